@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of Polygons.preprocess on rings of various sizes
+
+Compares the hash based deduplication with the former quadratic one
+(the quadratic one is only run for small rings, it would take hours otherwise).
+
+Run from the repository root: python benchmark/bench_preprocess.py
+"""
+import math
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import p2t
+
+from citygml2stl import polygons
+
+
+SIZES = (10, 1000, 100000)
+QUADRATIC_LIMIT = 10000
+
+
+def ring(size):
+    """
+    A circle of given number of points, with every tenth point duplicated
+    """
+    points = []
+    for i in range(size):
+        angle = 2 * math.pi * i / size
+        points.append(p2t.Point(math.cos(angle) * 1000, math.sin(angle) * 1000))
+        if not i % 10:
+            points.append(p2t.Point(points[-1].x, points[-1].y))
+    return points
+
+
+def quadratic(points):
+    """
+    The former nested loop deduplication, for comparison
+    """
+    uniq = []
+    is_line = True
+
+    for point in points:
+        is_uniq = True
+        for candidate in uniq:
+            if point.x == candidate.x and point.y == candidate.y:
+                is_uniq = False
+                break
+
+        if is_uniq:
+            uniq.append(point)
+
+            if is_line:
+                if len(uniq) > 2:
+                    if not line.is_on(point):
+                        is_line = False
+                elif len(uniq) == 2:
+                    line = polygons.Line(*uniq)
+
+    if is_line:
+        return []
+    return uniq
+
+
+def best(function, points):
+    """
+    Best time of a few runs of function on points, in seconds
+    """
+    number = max(1, 10000 // len(points))
+    return min(timeit.repeat(lambda: function(points), number=number, repeat=3)) / number
+
+
+def main():
+    print('{:>8} {:>14} {:>14} {:>14}'.format('points', 'hashed [s]', 'per point [us]',
+                                             'quadratic [s]'))
+    for size in SIZES:
+        points = ring(size)
+        assert len(polygons.Polygons.preprocess(points)) == size
+        hashed = best(polygons.Polygons.preprocess, points)
+        if size <= QUADRATIC_LIMIT:
+            old = '{:14.6f}'.format(best(quadratic, points))
+        else:
+            old = '{:>14}'.format('skipped')
+        print('{:8d} {:14.6f} {:14.3f} {}'.format(size, hashed, hashed / size * 1e6, old))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+Offline benchmark of all conversion stages on synthetic CityGML
+
+Generates a synthetic CityGML file (see synthetic.py) and times each stage separately,
+reporting throughput and peak memory. Results can be saved as JSON to diff between releases.
+
+Run from the repository root: python benchmark/run.py --buildings 1000 --output results.json
+"""
+import collections
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from citygml2stl import __version__
+from citygml2stl import citygml
+from citygml2stl import polygons
+from citygml2stl import stl
+
+import synthetic
+
+
+MB = 1024.0 * 1024.0
+
+
+class Stage(object):
+    """
+    Context manager measuring wall time and peak memory of one stage
+    """
+
+    # tracing Python allocations slows everything down a lot, so it is optional
+    trace = False
+
+    def __init__(self, results, name):
+        self.results = results
+        self.name = name
+
+    def __enter__(self):
+        if self.trace:
+            tracemalloc.start()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        seconds = time.time() - self.start
+        result = {'seconds': seconds}
+        if self.trace:
+            result['python_peak_mb'] = tracemalloc.get_traced_memory()[1] / MB
+            tracemalloc.stop()
+        # ru_maxrss is in kilobytes on Linux, the peak of the whole process so far
+        result['process_peak_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        self.results[self.name] = result
+
+    def rate(self, key, amount):
+        """
+        Save amount per second of this stage under the given key
+        """
+        seconds = self.results[self.name]['seconds']
+        self.results[self.name][key] = amount / seconds if seconds else None
+
+
+def run(args, directory):
+    """
+    Run all the stages, return the results dictionary
+    """
+    stages = collections.OrderedDict()
+    path = os.path.join(directory, 'synthetic.gml')
+
+    with Stage(stages, 'generate') as stage:
+        synthetic.generate(path, args.buildings, args.polygons, args.vertices, args.holes,
+                           args.citygml)
+    size = os.path.getsize(path) / MB
+    stage.rate('mb_per_s', size)
+
+    with Stage(stages, 'parse') as stage:
+        c = citygml.CityGML(path)
+    stage.rate('mb_per_s', size)
+
+    with Stage(stages, 'get_objects_of_types') as stage:
+        objects = c.get_objects_of_types('Building')
+    stage.rate('objects_per_s', len(objects))
+
+    with Stage(stages, 'stream') as stage:
+        streamed = sum(1 for obj in citygml.CityGML(path, stream=True).iter_city_objects())
+    stage.rate('mb_per_s', size)
+    stage.rate('objects_per_s', streamed)
+
+    with Stage(stages, 'triangulate_all') as stage:
+        triangles = [polygons.Polygons.triangulate_all(obj) for obj in objects]
+    number = sum(len(t) for t in triangles)
+    stage.rate('objects_per_s', len(objects))
+    stage.rate('triangles_per_s', number)
+
+    for binary in (False, True):
+        name = 'write_triangles_{}'.format('binary' if binary else 'ascii')
+        output = os.path.join(directory, name + '.stl')
+        with Stage(stages, name) as stage:
+            with stl.StlFile(output, binary=binary) as ofile:
+                for t in triangles:
+                    ofile.write_triangles(t)
+        stage.rate('triangles_per_s', number)
+        stage.rate('mb_per_s', os.path.getsize(output) / MB)
+
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'config': {
+            'buildings': args.buildings,
+            'polygons': args.polygons,
+            'vertices': args.vertices,
+            'holes': args.holes,
+            'citygml': args.citygml,
+        },
+        'input_mb': size,
+        'objects': len(objects),
+        'triangles': number,
+        'stages': stages,
+    }
+
+
+def report(results):
+    """
+    Print the results as a table
+    """
+    print('citygml2stl {version}, {implementation} {python}'.format(**results))
+    print('{objects} objects, {triangles} triangles, {input_mb:.1f} MB input'.format(**results))
+    columns = ('seconds', 'mb_per_s', 'objects_per_s', 'triangles_per_s', 'process_peak_mb')
+    print('{:<24}'.format('stage') + ''.join('{:>16}'.format(c) for c in columns))
+    for name, stage in results['stages'].items():
+        values = []
+        for column in columns:
+            value = stage.get(column)
+            values.append('{:>16}'.format('-') if value is None else '{:16.3f}'.format(value))
+        print('{:<24}'.format(name) + ''.join(values))
+
+
+def main():
+    parser = synthetic.get_parser()
+    parser.description = __doc__.strip().splitlines()[0]
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also measure peak Python memory per stage (slow)')
+    args = parser.parse_args()
+    if args.trace_memory and tracemalloc is None:
+        parser.error('--trace-memory needs Python 3.4+')
+    Stage.trace = args.trace_memory
+
+    directory = tempfile.mkdtemp(prefix='citygml2stl-benchmark-')
+    try:
+        results = run(args, directory)
+    finally:
+        shutil.rmtree(directory)
+
+    report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
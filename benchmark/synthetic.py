@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Generator of synthetic CityGML files for benchmarking
+
+Every building is a stack of regular polygons with the given number of vertices,
+alternately horizontal (floors) and vertical (walls), each with the given number of holes.
+
+Run from the repository root: python benchmark/synthetic.py --buildings 1000 out.gml
+"""
+import argparse
+import math
+
+
+NAMESPACES = {
+    '1.0': ('http://www.opengis.net/citygml/1.0',
+            'http://www.opengis.net/citygml/building/1.0'),
+    '2.0': ('http://www.opengis.net/citygml/2.0',
+            'http://www.opengis.net/citygml/building/2.0'),
+}
+
+GML = 'http://www.opengis.net/gml'
+
+# distance between buildings and their radius
+SPACING = 50.0
+RADIUS = 20.0
+# height of one floor
+FLOOR = 3.0
+
+
+def regular_polygon(cx, cy, radius, vertices):
+    """
+    Return a list of 2D points of a closed regular polygon
+    """
+    points = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        points.append((cx + radius * math.cos(angle), cy + radius * math.sin(angle)))
+    return points + points[:1]
+
+
+def rings(vertices, holes):
+    """
+    Return an exterior ring and a list of interior rings of a polygon in local 2D coordinates
+    """
+    exterior = regular_polygon(0, 0, RADIUS, vertices)
+    interiors = []
+    if holes:
+        radius = RADIUS * min(0.2, math.sin(math.pi / max(holes, 2)) / 4)
+        for i in range(holes):
+            angle = 2 * math.pi * i / holes
+            cx, cy = RADIUS / 2 * math.cos(angle), RADIUS / 2 * math.sin(angle)
+            # holes are oriented the other way than the exterior
+            interiors.append(regular_polygon(cx, cy, radius, vertices)[::-1])
+    return exterior, interiors
+
+
+def poslist(points):
+    """
+    Format a list of 3D points as a gml:posList
+    """
+    return '<gml:posList srsDimension="3">{}</gml:posList>'.format(
+        ' '.join('{:.3f} {:.3f} {:.3f}'.format(*p) for p in points))
+
+
+def polygon(exterior, interiors, to3d):
+    """
+    Format a gml:Polygon from 2D rings and a function placing 2D points to 3D
+    """
+    parts = ['<gml:Polygon><gml:exterior><gml:LinearRing>',
+             poslist(map(to3d, exterior)),
+             '</gml:LinearRing></gml:exterior>']
+    for ring in interiors:
+        parts += ['<gml:interior><gml:LinearRing>',
+                  poslist(map(to3d, ring)),
+                  '</gml:LinearRing></gml:interior>']
+    parts.append('</gml:Polygon>')
+    return ''.join(parts)
+
+
+def building(index, columns, polygons, vertices, holes):
+    """
+    Format one bldg:Building city object member
+    """
+    x = (index % columns) * SPACING
+    y = (index // columns) * SPACING
+    exterior, interiors = rings(vertices, holes)
+    parts = ['<core:cityObjectMember><bldg:Building gml:id="BLD_{}">'.format(index),
+             '<bldg:lod2MultiSurface><gml:MultiSurface>']
+    for i in range(polygons):
+        z = (i // 2) * FLOOR
+        if i % 2:
+            def to3d(p):
+                return (x + p[0], y, z + RADIUS + p[1])
+        else:
+            def to3d(p):
+                return (x + p[0], y + p[1], z)
+        parts += ['<gml:surfaceMember>', polygon(exterior, interiors, to3d), '</gml:surfaceMember>']
+    parts.append('</gml:MultiSurface></bldg:lod2MultiSurface></bldg:Building>'
+                 '</core:cityObjectMember>\n')
+    return ''.join(parts)
+
+
+def generate(filename, buildings=100, polygons=10, vertices=5, holes=0, version='2.0'):
+    """
+    Write a synthetic CityGML file of the given version and size
+    """
+    core, bldg = NAMESPACES[version]
+    columns = max(1, int(math.ceil(math.sqrt(buildings))))
+    with open(filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<core:CityModel xmlns:core="{}" xmlns:bldg="{}" xmlns:gml="{}">\n'.format(
+            core, bldg, GML))
+        for index in range(buildings):
+            f.write(building(index, columns, polygons, vertices, holes))
+        f.write('</core:CityModel>\n')
+
+
+def get_parser():
+    """
+    Construct the argument parser shared with the benchmark runner
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--buildings', type=int, default=100, help='number of buildings')
+    parser.add_argument('--polygons', type=int, default=10, help='polygons per building')
+    parser.add_argument('--vertices', type=int, default=5, help='vertices per ring')
+    parser.add_argument('--holes', type=int, default=0, help='holes per polygon')
+    parser.add_argument('--citygml', choices=sorted(NAMESPACES), default='2.0',
+                        help='CityGML version')
+    return parser
+
+
+def main():
+    parser = get_parser()
+    parser.add_argument('filename', help='output file')
+    args = parser.parse_args()
+    generate(args.filename, args.buildings, args.polygons, args.vertices, args.holes,
+             args.citygml)
+
+
+if __name__ == '__main__':
+    main()
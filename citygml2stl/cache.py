@@ -0,0 +1,138 @@
+import collections
+import hashlib
+import os
+import re
+
+import numpy
+from lxml import etree
+
+from . import exceptions
+from . import mesh
+from . import parallel
+from . import polygons
+
+
+class TriangleCache(object):
+    """
+    Directory of triangulated city objects, keyed by their gml:id and a hash of their content
+
+    Every object is stored as a .npy file of its (N, 3, 3) triangles, named by a hash
+    of its gml:id and a hash of its serialized XML (and the triangulation options),
+    so a changed object gets a new entry and unchanged objects are just loaded on rerun.
+    Entries not used since the cache was opened can be removed with evict().
+    """
+    # bump when the triangulation changes, so old entries are not used anymore
+    version = 2
+    extension = '.npy'
+    # names of the entries and of their temporary files, other files are left alone
+    pattern = re.compile(r'^([0-9a-f]{16}_[0-9a-f]{40})\.npy(\.tmp)?$')
+
+    def __init__(self, directory):
+        """
+        Open the cache in the given directory, creating it if needed
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.used = set()
+
+    def key(self, obj, merge=None, lod=None):
+        """
+        Gets the key of the given city object triangulated with the given options
+        """
+        identifier = obj.get('{{{}}}id'.format(polygons.Polygons.gml)) or ''
+        content = hashlib.sha1(etree.tostring(obj, with_tail=False))
+        content.update(repr((self.version, merge, lod)).encode('ascii'))
+        return '{}_{}'.format(hashlib.sha1(identifier.encode('utf-8')).hexdigest()[:16],
+                              content.hexdigest())
+
+    def path(self, key):
+        """
+        Gets the path of the entry of the given key
+        """
+        return os.path.join(self.directory, key + self.extension)
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def load(self, key):
+        """
+        Load the triangles of the given key, return a TriangleMesh
+
+        A broken entry is removed and CityGMLError is raised
+        """
+        try:
+            array = numpy.load(self.path(key))
+        except (IOError, OSError, ValueError) as e:
+            if os.path.exists(self.path(key)):
+                os.remove(self.path(key))
+            raise exceptions.CityGMLError(
+                'Broken cache entry {} removed, convert again: {}'.format(self.path(key), e))
+        self.used.add(key)
+        return mesh.TriangleMesh.from_array(array.reshape(-1, 3, 3))
+
+    def store(self, key, triangles):
+        """
+        Store the triangles (a TriangleMesh) of the given key
+        """
+        path = self.path(key)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            numpy.save(f, triangles.array)
+        # atomic, so an interrupted run doesn't leave a broken entry behind
+        getattr(os, 'replace', os.rename)(temporary, path)
+        self.used.add(key)
+
+    def triangulate_objects(self, objects, workers=None, chunksize=8, stats=None, merge=None,
+                            lod=None):
+        """
+        Yield TriangleMesh of every given city object in order, only triangulating new ones
+
+        Objects found in the cache are loaded, the others are triangulated
+        (see parallel.triangulate_objects()) and stored.
+        Cached entries are only loaded when their turn comes,
+        so objects can be streamed even when most of them are cached.
+        If stats are given, cached and triangulated objects are counted.
+        """
+        pending = collections.deque()
+
+        def new_objects():
+            for obj in objects:
+                key = self.key(obj, merge, lod)
+                hit = key in self
+                pending.append((key, hit))
+                if not hit:
+                    yield obj
+
+        def cached():
+            while pending and pending[0][1]:
+                if stats is not None:
+                    stats.count('cached objects')
+                yield self.load(pending.popleft()[0])
+
+        for triangles in parallel.triangulate_objects(new_objects(), workers, chunksize,
+                                                      stats, merge, lod):
+            for loaded in cached():
+                yield loaded
+            key, hit = pending.popleft()
+            self.store(key, triangles)
+            if stats is not None:
+                stats.count('triangulated objects')
+            yield triangles
+        for loaded in cached():
+            yield loaded
+
+    def evict(self):
+        """
+        Remove entries not used since the cache was opened, return their number
+
+        Temporary files left behind by interrupted runs are removed as well,
+        files not named like cache entries are kept.
+        """
+        evicted = 0
+        for name in os.listdir(self.directory):
+            match = self.pattern.match(name)
+            if match and (match.group(2) or match.group(1) not in self.used):
+                os.remove(os.path.join(self.directory, name))
+                evicted += 1
+        return evicted
@@ -1,7 +1,22 @@
+import bz2
+import collections
+import contextlib
+import gzip
+import heapq
 import os
+import zipfile
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+import numpy
 from lxml import etree
 
 from . import exceptions
+from . import polygons
+from . import spatial
 
 
 class CityGML(object):
@@ -14,12 +29,43 @@ class CityGML(object):
         'http://www.opengis.net/citygml/2.0',
     ]
 
-    def __init__(self, filename):
+    # all city object members of all the namespaces in one precompiled query
+    _members = etree.XPath(
+        ' | '.join('//c{}:cityObjectMember'.format(i) for i in range(len(namespaces))),
+        namespaces=dict(('c{}'.format(i), ns) for i, ns in enumerate(namespaces)))
+
+    _envelope = etree.ETXPath('./{{{0}}}boundedBy/{{{0}}}Envelope'.format(polygons.Polygons.gml))
+    _corners = etree.ETXPath('./{{{0}}}lowerCorner | ./{{{0}}}upperCorner | ./{{{0}}}pos'.format(
+        polygons.Polygons.gml))
+
+    # extensions of compressed files and functions opening them, decompressing on the fly
+    compressions = {
+        '.gz': gzip.GzipFile,
+        '.bz2': bz2.BZ2File,
+        '.xz': lzma and lzma.LZMAFile,
+    }
+
+    def __init__(self, filename, stream=False, stats=None, member=None):
         """
         Initialize the CityGML object by parsing the file located at the given path
+
+        The file can be compressed by gzip, bzip2 or xz, or it can be a zip archive,
+        where member is the name of the CityGML file inside it.
+        Without member, the only .gml or .xml file of the archive is used.
+        Files are decompressed while being parsed, without extracting them to disk.
+        With stream=True, the file is not parsed upfront,
+        use iter_city_objects() to read the city objects one by one.
+        If stats are given, the parsing time is added to them.
+        When parsed upfront, ids is a dictionary of gml:id to elements of the whole document,
+        pass it to polygons.object2triangles() to resolve references between city objects.
         """
         self.filename = self._get_xml_file(filename)
-        self._parse_xml()
+        self.member = self._get_member(member)
+        self.namespace = None
+        self.ids = None
+        self.stats = stats
+        if not stream:
+            self._parse_xml()
 
     def _get_xml_file(self, filename):
         """
@@ -35,32 +81,292 @@ class CityGML(object):
             return inside
         return filename
 
+    def _get_member(self, member):
+        """
+        Gets the name of the CityGML file inside a zip archive, None for other files
+        """
+        if not self.filename.endswith('.zip'):
+            if member is not None:
+                raise exceptions.CityGMLInputError('{} is not a zip archive'.format(self.filename))
+            return None
+        members = archive_members(self.filename)
+        if member is not None:
+            if member not in members:
+                raise exceptions.CityGMLInputError('{} does not contain {}'.format(
+                    self.filename, member))
+            return member
+        if len(members) != 1:
+            raise exceptions.CityGMLInputError(
+                '{} contains {} CityGML files, choose one of: {}'.format(
+                    self.filename, len(members), ', '.join(members)))
+        return members[0]
+
+    @contextlib.contextmanager
+    def _source(self):
+        """
+        Opens the file to parse
+
+        Yields a file object decompressing the file on the fly
+        or just the filename for uncompressed files, so lxml reads them directly
+        """
+        if self.member is not None:
+            with zipfile.ZipFile(self.filename) as archive:
+                with archive.open(self.member) as source:
+                    yield source
+            return
+        extension = os.path.splitext(self.filename)[1]
+        if extension not in CityGML.compressions:
+            yield self.filename
+            return
+        opener = CityGML.compressions[extension]
+        if opener is None:
+            raise exceptions.CityGMLInputError(
+                'Reading {} files needs the lzma module'.format(extension))
+        with opener(self.filename, 'rb') as source:
+            yield source
+
     def _parse_xml(self):
         """
-        Saves the parsed XML tree, CityGML namespace and list of city_objects
+        Saves the parsed XML tree, CityGML namespace and list of city_objects,
+        indexes the city objects by their types and all elements by their gml:id
         """
-        self.tree = etree.parse(self.filename)
+        if self.stats is not None:
+            self.stats.lap()
+        with self._source() as source:
+            self.tree = etree.parse(source)
+        if self.stats is not None:
+            self.stats.lap('parse')
+        members = collections.defaultdict(list)
+        for member in CityGML._members(self.tree):
+            members[etree.QName(member).namespace].append(member)
         for ns in CityGML.namespaces:
-            identifier = '//{{{}}}cityObjectMember'.format(ns)
-            self.city_objects = self.tree.findall(identifier)
+            self.city_objects = members[ns]
             if self.city_objects:
                 self.namespace = ns
+                self._index_types()
+                self.ids = polygons.Polygons.index_ids(self.tree.getroot())
+                if self.stats is not None:
+                    self.stats.lap('index')
                 return
-        if not self.city_objects:
-            raise exceptions.CityGMLInputError('Found no city objects in {}'.format(self.filename))
+        raise exceptions.CityGMLInputError('Found no city objects in {}'.format(self.filename))
 
-    def get_objects_of_types(self, *args):
+    def _index_types(self):
         """
-        Return a list of city objects of the given types
+        Builds an index of city objects positions by their type (local tag name)
+        """
+        self._objects = []
+        self._types = collections.OrderedDict()
+        for member in self.city_objects:
+            for child in member:
+                name = CityGML._local_name(child)
+                if name is None:
+                    continue
+                self._types.setdefault(name, []).append(len(self._objects))
+                self._objects.append(child)
+
+    @classmethod
+    def _local_name(cls, element):
         """
-        objects = []
-        types = args
-        for obj in self.city_objects:
-            for child in obj:
-                for t in types:
-                    if str(child.tag).endswith('}' + t):
-                        objects.append(child)
-                        break
-                if not types:
-                    objects.append(child)
+        Gets the tag name of the element without the namespace, None for comments and similar
+        """
+        tag = element.tag
+        if callable(tag):
+            return None
+        return tag.rpartition('}')[2]
+
+    def types(self):
+        """
+        Return an ordered dictionary of types of city objects and their counts
+
+        When the file was opened with stream=True, the whole file is streamed through to count them
+        """
+        if not hasattr(self, 'tree'):
+            counts = collections.OrderedDict()
+            for obj in self._iterparse(()):
+                name = CityGML._local_name(obj)
+                counts[name] = counts.get(name, 0) + 1
+            return counts
+        return collections.OrderedDict(
+            (name, len(positions)) for name, positions in self._types.items())
+
+    def _check_parsed(self, method):
+        """
+        Raise CityGMLInputError if the file was opened with stream=True,
+        as the indexed queries need the whole document parsed
+        """
+        if not hasattr(self, 'tree'):
+            raise exceptions.CityGMLInputError(
+                '{}() needs {} opened without stream=True, use iter_city_objects() or '
+                'iter_objects_in_bbox() to stream it'.format(method, self.filename))
+
+    def get_objects_of_types(self, *args, **kwargs):
+        """
+        Return a list of city objects of the given types, in the document order
+
+        With lod=N (or 'highest' or 'lowest'), only objects with some geometry
+        in that level of detail are returned, see polygons.Polygons.lod_branches(),
+        pass the same lod to polygons.object2triangles() to triangulate just that geometry
+        """
+        lod = kwargs.pop('lod', None)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments: {}'.format(', '.join(kwargs)))
+        self._check_parsed('get_objects_of_types')
+        if not args:
+            objects = list(self._objects)
+        else:
+            positions = [self._types[t] for t in set(args) if t in self._types]
+            if len(positions) == 1:
+                objects = [self._objects[i] for i in positions[0]]
+            else:
+                objects = [self._objects[i] for i in heapq.merge(*positions)]
+        if lod is not None:
+            objects = [obj for obj in objects if polygons.Polygons.has_lod(obj, lod)]
         return objects
+
+    def bounding_box(self, obj, lod=None, flat=False):
+        """
+        Return the 3D bounding box (minx, miny, minz, maxx, maxy, maxz) of a city object
+
+        The gml:Envelope of the object is used when present,
+        otherwise the box is computed from all the coordinates of the object.
+        An envelope without z coordinates (srsDimension 2) is only used if flat is set,
+        i.e. when just the x and y of the box are needed.
+        If lod is given, the box is computed from the geometry in that level of detail
+        (see polygons.Polygons.bounding_box()), the envelope is not used as it covers all levels.
+        Return None for objects without any coordinates.
+        """
+        envelope = CityGML._envelope(obj) if lod is None else None
+        if envelope:
+            try:
+                corners = [corner for corner in CityGML._corners(envelope[0])
+                           if flat or polygons.Polygons.srs_dimension(corner) == 3]
+                corners = [polygons.Polygons.coordinates_to_array(corner) for corner in corners]
+                corners = numpy.vstack(corners) if corners else ()
+            except exceptions.CityGMLCoordinatesError:
+                corners = ()
+            if len(corners) == 2:
+                return tuple(corners.min(axis=0).tolist() + corners.max(axis=0).tolist())
+        return polygons.Polygons.bounding_box(obj, lod, self.ids)
+
+    def extent(self, objects=None, lod=None):
+        """
+        Return the 3D bounding box (minx, miny, minz, maxx, maxy, maxz) of the given city objects
+
+        All city objects are used if not given, None is returned if none has any coordinates.
+        If lod is given, only the geometry in that level of detail is measured.
+        """
+        if objects is None:
+            objects = self.iter_city_objects()
+        boxes = [box for box in (self.bounding_box(obj, lod) for obj in objects) if box]
+        if not boxes:
+            return None
+        boxes = numpy.array(boxes)
+        return tuple(boxes[:, :3].min(axis=0).tolist() + boxes[:, 3:].max(axis=0).tolist())
+
+    def _spatial_index(self):
+        """
+        Gets the spatial index of all city objects, builds it on first use
+        """
+        if not hasattr(self, '_grid'):
+            boxes = []
+            for obj in self._objects:
+                box = self.bounding_box(obj, flat=True)
+                boxes.append(box and (box[0], box[1], box[3], box[4]))
+            self._grid = spatial.GridIndex(boxes)
+        return self._grid
+
+    def get_objects_in_bbox(self, minx, miny, maxx, maxy, *args):
+        """
+        Return a list of city objects of the given types intersecting the given 2D box,
+        in the document order
+
+        Bounding boxes of all the objects are indexed on first call,
+        later calls only check the objects in the grid cells overlapping the box
+        """
+        self._check_parsed('get_objects_in_bbox')
+        positions = self._spatial_index().query(minx, miny, maxx, maxy)
+        types = set(args)
+        objects = [self._objects[i] for i in positions]
+        if types:
+            objects = [obj for obj in objects if CityGML._local_name(obj) in types]
+        return objects
+
+    def iter_objects_in_bbox(self, minx, miny, maxx, maxy, *args):
+        """
+        Yield city objects of the given types intersecting the given 2D box one by one
+
+        When the file was opened with stream=True, bounding box of every streamed object
+        is checked, otherwise the spatial index is used
+        """
+        if hasattr(self, 'tree'):
+            for obj in self.get_objects_in_bbox(minx, miny, maxx, maxy, *args):
+                yield obj
+            return
+        box = (minx, miny, maxx, maxy)
+        for obj in self.iter_city_objects(*args):
+            objbox = self.bounding_box(obj, flat=True)
+            if objbox and spatial.intersects((objbox[0], objbox[1], objbox[3], objbox[4]), box):
+                yield obj
+
+    def iter_city_objects(self, *args):
+        """
+        Yield city objects of the given types one by one
+
+        When the file was opened with stream=True, it is parsed incrementally
+        and every city object member is freed once the next one is requested,
+        so only one city object is held in memory at a time
+        """
+        if not hasattr(self, 'tree'):
+            for obj in self._iterparse(args):
+                yield obj
+            return
+        for obj in self.get_objects_of_types(*args):
+            yield obj
+
+    def _iterparse(self, types):
+        """
+        Incrementally parse the file and yield city objects of the given types
+
+        The CityGML namespace is detected from the first city object member found
+        """
+        tags = ['{{{}}}cityObjectMember'.format(ns) for ns in CityGML.namespaces]
+        with self._source() as source:
+            context = etree.iterparse(source, events=('end',), tag=tags, huge_tree=True)
+            found = False
+            types = set(types)
+            if self.stats is not None:
+                self.stats.lap()
+            for event, member in context:
+                if self.stats is not None:
+                    self.stats.lap('parse')
+                namespace = etree.QName(member).namespace
+                if self.namespace is None:
+                    self.namespace = namespace
+                if namespace == self.namespace:
+                    found = True
+                    for child in member:
+                        name = CityGML._local_name(child)
+                        if name is not None and (not types or name in types):
+                            yield child
+                # free the processed member and everything parsed before it
+                member.clear()
+                while member.getprevious() is not None:
+                    del member.getparent()[0]
+                if self.stats is not None:
+                    self.stats.lap()
+            del context
+        if not found:
+            raise exceptions.CityGMLInputError('Found no city objects in {}'.format(self.filename))
+
+
+def archive_members(filename):
+    """
+    Return a list of names of CityGML (.gml and .xml) files in the given zip archive
+    """
+    try:
+        with zipfile.ZipFile(filename) as archive:
+            names = archive.namelist()
+    except zipfile.BadZipfile:
+        raise exceptions.CityGMLInputError('{} is not a valid zip archive'.format(filename))
+    return [name for name in names
+            if name.lower().endswith('.gml') or name.lower().endswith('.xml')]
@@ -1,8 +1,23 @@
+import argparse
+import json
+import os
 import sys
 
+from . import cache
 from . import citygml
+from . import exceptions
+from . import indexed
+from . import output
+from . import parallel
+from . import pipeline
 from . import polygons
+from . import repair
+from . import server
+from . import shards
+from . import stats as statistics
 from . import stl
+from . import tiles
+from . import transform
 from . import __version__
 
 
@@ -12,33 +27,370 @@ except NameError:
     unicode = str
 
 
-def main():
+def bbox(value):
+    """
+    Parse a minx,miny,maxx,maxy bounding box argument
+    """
+    try:
+        box = [float(v) for v in value.split(',')]
+    except ValueError:
+        box = []
+    if len(box) != 4:
+        raise argparse.ArgumentTypeError('{} is not in form minx,miny,maxx,maxy'.format(value))
+    return box
+
+
+def get_parser():
+    """
+    Construct the argument parser for the CLI
+    """
+    parser = argparse.ArgumentParser(description='CityGML {}'.format(__version__))
+    parser.add_argument('files', metavar='file', nargs='*',
+                        help='CityGML file or directory to convert, '
+                             'can be compressed (.gz, .bz2, .xz) or a .zip archive')
+    parser.add_argument('-o', '--output', metavar='PATH',
+                        help='output file (only with one input file), - for standard output, '
+                             'format is chosen by the extension: .stl, .obj or .ply, '
+                             'add .gz, .bz2 or .xz to compress it')
+    parser.add_argument('-b', '--binary', action='store_true',
+                        help='write binary STL instead of ASCII STL')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of processes to triangulate with (0 for number of CPUs)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='read, triangulate and write concurrently')
+    parser.add_argument('--sharded', action='store_true',
+                        help='parse parts of an uncompressed file in parallel too')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='keep triangulated city objects in the given directory and only '
+                             'triangulate new or changed ones on the next run, '
+                             'entries of objects not converted anymore are removed')
+    parser.add_argument('--bbox', type=bbox, metavar='MINX,MINY,MAXX,MAXY',
+                        help='only convert city objects intersecting the given box')
+    parser.add_argument('--tile-size', type=float, metavar='SIZE',
+                        help='write one STL file per square tile of the given size')
+    parser.add_argument('--merge-coplanar', type=float, nargs='?', const=0.01, metavar='TOLERANCE',
+                        help='merge adjacent coplanar polygons of each city object before '
+                             'triangulation, planes are compared with the given tolerance '
+                             '(default 0.01)')
+    parser.add_argument('--lod', type=lod, metavar='N',
+                        help='only convert geometry in the given level of detail, '
+                             'highest or lowest for the highest or lowest one of each object')
+    parser.add_argument('--repair', type=float, nargs='?', const=0.0, metavar='TOLERANCE',
+                        help='weld vertices of each city object (closer than the given '
+                             'tolerance, identical by default), drop triangles without area '
+                             'and duplicate triangles and report open and non-manifold edges')
+    parser.add_argument('--center', action='store_true',
+                        help='move the center of the converted objects to the origin')
+    parser.add_argument('--ground', action='store_true',
+                        help='move the bottom of the converted objects to z = 0')
+    parser.add_argument('--scale', type=float, metavar='FACTOR',
+                        help='multiply all coordinates by the given factor')
+    parser.add_argument('--fit-mm', type=size, metavar='WxDxH',
+                        help='scale the converted objects to fit into the given size '
+                             '(e.g. 180x180x100 for a print bed in millimeters)')
+    parser.add_argument('--serve', type=server.address, metavar='[HOST:]PORT',
+                        help='run a conversion server keeping parsed files in memory, '
+                             'files under the current directory are served')
+    parser.add_argument('--memory', type=float, default=1024, metavar='MB',
+                        help='memory budget of the files kept by --serve (default 1024)')
+    parser.add_argument('--stats', action='store_true',
+                        help='print time spent in each stage and counts of processed things')
+    parser.add_argument('--stats-json', metavar='FILE',
+                        help='save the stats of all converted files to the given JSON file')
+    return parser
+
+
+def lod(value):
+    """
+    Parse a level of detail argument: a number or highest or lowest
+    """
+    if value in polygons.Polygons.lod_policies:
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('{} is not a number, {}'.format(
+            value, ' or '.join(polygons.Polygons.lod_policies)))
+
+
+def size(value):
+    """
+    Parse a WIDTHxDEPTHxHEIGHT size argument
+    """
+    try:
+        dimensions = [float(v) for v in value.lower().split('x')]
+    except ValueError:
+        dimensions = []
+    if len(dimensions) != 3 or min(dimensions) <= 0:
+        raise argparse.ArgumentTypeError('{} is not in form WIDTHxDEPTHxHEIGHT'.format(value))
+    return dimensions
+
+
+def get_transform(args, box=None):
+    """
+    Construct the transform of the output coordinates asked for, None if there is none
+
+    Centering, grounding and fitting need box, the extent of the converted city objects
+    (see needs_extent())
+    """
+    if not (args.center or args.ground or args.scale or args.fit_mm):
+        return None
+    if box is None:
+        return transform.Transform(scale=args.scale or 1.0)
+    return transform.Transform.from_box(box, center=args.center, ground=args.ground,
+                                        scale=args.scale, size=args.fit_mm)
+
+
+def needs_extent(args):
+    """
+    Whether the transform asked for needs the extent of the converted city objects
+    """
+    return bool(args.center or args.ground or args.fit_mm)
+
+
+def stream_extent(ipath, member, args, stats=None):
+    """
+    Gets the extent of the city objects to convert by streaming through the input,
+    for the conversions writing the objects as soon as they are read
+    """
+    if stats is not None:
+        stats.lap()
+    c = citygml.CityGML(ipath, stream=True, member=member)
+    box = c.extent(c.iter_objects_in_bbox(*args.bbox) if args.bbox else None, args.lod)
+    if stats is not None:
+        stats.lap('extent')
+    return box
+
+
+def mesh_file(opath, args, stats=None, transformation=None):
+    """
+    Construct the writer of the output file based on its extension
+    """
+    name = output.strip_compression(opath)
+    if name.endswith('.obj'):
+        return indexed.ObjFile(opath, stats=stats, transform=transformation)
+    if name.endswith('.ply'):
+        return indexed.PlyFile(opath, stats=stats, transform=transformation)
+    return stl.StlFile(opath, binary=args.binary, stats=stats, transform=transformation)
+
+
+def repaired(ofile, args, stats=None):
+    """
+    Wrap the writer to repair the triangles before writing them, if asked for
+    """
+    if args.repair is None:
+        return ofile
+    return repair.RepairingWriter(ofile, args.repair, stats)
+
+
+def expand_input(ipath):
+    """
+    Return a list of (path, member) pairs to convert from one input path
+
+    Zip archives with several CityGML files are expanded to all of them,
+    member is None for all other inputs
+    """
+    if ipath.endswith('.zip') and os.path.isfile(ipath):
+        members = citygml.archive_members(ipath)
+        if len(members) > 1:
+            return [(ipath, member) for member in members]
+    return [(ipath, None)]
+
+
+def output_path(ipath, member=None):
+    """
+    Derive the STL output path from the input path (and zip archive member)
+    """
+    name = ipath
+    for extension in sorted(citygml.CityGML.compressions) + ['.zip']:
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+            break
+    if name.endswith('.xml') or name.endswith('.gml'):
+        name = name[:-4]
+    if member is not None:
+        name += '_' + os.path.splitext(os.path.basename(member))[0]
+    return name + '.stl'
+
+
+def tiles_name(opath):
+    """
+    Derive the common start of the tile filenames from the output path
+    """
+    return opath[:-4] if opath.endswith('.stl') else opath
+
+
+def convert(ipath, member, opath, args, stats=None, triangle_cache=None, transformation=None):
+    """
+    Convert one CityGML file to one mesh file, streaming the input
+
+    If a triangle_cache is given, only objects missing in it are triangulated
+    """
+    if args.pipeline:
+        # the reader and the writer run in their own threads, measure them separately
+        stages = [statistics.Stats() if stats is not None else None for i in range(2)]
+    else:
+        stages = [stats, stats]
+    c = citygml.CityGML(ipath, stream=True, stats=stages[0], member=member)
+    with mesh_file(opath, args, stages[1], transformation) as ofile:
+        ofile = repaired(ofile, args, stages[1])
+        if args.bbox:
+            objects = c.iter_objects_in_bbox(*args.bbox)
+        else:
+            objects = c.iter_city_objects()
+        if args.pipeline:
+            pipeline.convert(objects, ofile, workers=args.jobs or None, stats=stats,
+                             merge=args.merge_coplanar, lod=args.lod)
+        else:
+            if triangle_cache is not None:
+                triangulate = triangle_cache.triangulate_objects
+            else:
+                triangulate = parallel.triangulate_objects
+            for triangles in triangulate(objects, workers=args.jobs or None, stats=stats,
+                                         merge=args.merge_coplanar, lod=args.lod):
+                ofile.write_triangles(triangles)
+    if args.pipeline and stats is not None:
+        for stage in stages:
+            stats.merge(stage)
+
+
+def convert_sharded(ipath, member, opath, args, stats=None, transformation=None):
+    """
+    Convert one uncompressed CityGML file to one mesh file, parsing shards of it in parallel
+    """
+    if member is not None:
+        raise exceptions.CityGMLInputError('{} is compressed, only uncompressed files '
+                                           'can be sharded'.format(ipath))
+    with mesh_file(opath, args, stats, transformation) as ofile:
+        ofile = repaired(ofile, args, stats)
+        for triangles in shards.triangulate_file(ipath, box=args.bbox, workers=args.jobs or None,
+                                                 stats=stats, merge=args.merge_coplanar,
+                                                 lod=args.lod):
+            ofile.write_triangles(triangles)
+
+
+def convert_tiles(ipath, member, name, args, stats=None):
+    """
+    Convert one CityGML file to one STL file per tile
+
+    The whole file is parsed, so the extent for the transform is taken from it
+    """
+    c = citygml.CityGML(ipath, stats=stats, member=member)
+    objects = c.get_objects_in_bbox(*args.bbox) if args.bbox else c.get_objects_of_types()
+    if args.lod is not None:
+        objects = [obj for obj in objects if polygons.Polygons.has_lod(obj, args.lod)]
+    if needs_extent(args):
+        if stats is not None:
+            stats.lap()
+        transformation = get_transform(args, c.extent(objects, args.lod))
+        if stats is not None:
+            stats.lap('extent')
+    else:
+        transformation = get_transform(args)
+    tiles.export_tiles(c, name, args.tile_size, objects=objects,
+                       binary=args.binary, workers=args.jobs or None, stats=stats,
+                       merge=args.merge_coplanar, lod=args.lod, repair=args.repair,
+                       transform=transformation)
+
+
+def main(argv=None):
     """
     Simple CLI interafce for citygml2stl
     """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    parser = get_parser()
 
-    if len(sys.argv) == 1 or '--help' in sys.argv or 'help' in sys.argv:
-        print('CityGML {}'.format(__version__))
-        print('Usage: {} [file [file [file...]]]'.format(sys.argv[0]))
+    if not argv or '--help' in argv or '-h' in argv or 'help' in argv:
+        parser.print_help()
         return 0
 
+    args = parser.parse_args(argv)
+    if args.serve:
+        sys.stdout.write('Serving {} at http://{}:{}/\n'.format(os.getcwd(), *args.serve))
+        sys.stdout.flush()
+        server.serve(args.serve, budget=int(args.memory * 1024 * 1024))
+        return 0
     ret = 0
+    measured = {}
+
+    inputs = []
+    for ipath in args.files:
+        try:
+            inputs += expand_input(ipath)
+        except exceptions.CityGMLInputError as e:
+            sys.stderr.write('Error: ' + unicode(e) + '\n')
+            ret = 1
+    if args.output and len(inputs) > 1:
+        parser.error('--output can only be used with one input file')
+    if args.output == '-' and args.tile_size:
+        parser.error('--tile-size cannot write to the standard output')
+    if args.output and args.tile_size and (
+            output.strip_compression(args.output) != args.output or
+            os.path.splitext(args.output)[1] in ('.obj', '.ply')):
+        parser.error('--tile-size only writes uncompressed STL files')
+    if args.cache and (args.tile_size or args.pipeline or args.sharded):
+        parser.error('--cache cannot be used with --tile-size, --pipeline or --sharded')
+    if args.scale and args.fit_mm:
+        parser.error('--scale cannot be used with --fit-mm')
+    triangle_cache = cache.TriangleCache(args.cache) if args.cache else None
+    # keep the standard output clean when writing the mesh there
+    messages = sys.stderr if args.output == '-' else sys.stdout
 
-    for ipath in sys.argv[1:]:
-        if ipath.endswith('.xml') or ipath.endswith('.gml'):
-            opath = ipath[:-3] + 'stl'
+    for ipath, member in inputs:
+        opath = args.output or output_path(ipath, member)
+        source = ipath if member is None else '{}:{}'.format(ipath, member)
+
+        if args.tile_size:
+            name = tiles_name(opath)
+            messages.write('Converting {} to {}\n'.format(
+                source, tiles.tile_filename(name, 'ROW', 'COL')))
         else:
-            opath = ipath + '.stl'
+            messages.write('Converting {} to {}\n'.format(source, opath))
 
-        print('Converting {} to {}'.format(ipath, opath))
+        # always measured, unresolved xlinks are reported even without --stats
+        stats = statistics.Stats()
 
         try:
-            c = citygml.CityGML(ipath)
-            with stl.StlFile(opath) as ofile:
-                for obj in c.get_objects_of_types():
-                    ofile.write_triangles(polygons.object2triangles(obj))
+            if args.tile_size:
+                convert_tiles(ipath, member, name, args, stats)
+            else:
+                box = stream_extent(ipath, member, args, stats) if needs_extent(args) else None
+                transformation = get_transform(args, box)
+                if args.sharded:
+                    convert_sharded(ipath, member, opath, args, stats, transformation)
+                else:
+                    convert(ipath, member, opath, args, stats, triangle_cache, transformation)
         except Exception as e:
             sys.stderr.write('Error: ' + unicode(e) + '\n')
             ret = 1
 
+        if stats.counts.get('unresolved xlinks'):
+            sys.stderr.write('Warning: {} xlinks were not resolved, geometry they reference '
+                             'is missing or belongs to another city object and was '
+                             'skipped\n'.format(stats.counts['unresolved xlinks']))
+        # nothing is triangulated when all the objects were cached
+        if args.merge_coplanar is not None and stats.counts.get('triangles'):
+            messages.write('Merged coplanar polygons: {} triangles instead of about {}\n'.format(
+                stats.counts['triangles'], stats.counts.get('triangles before merging', 0)))
+        if args.repair is not None:
+            messages.write('Repaired: {} degenerate and {} duplicate triangles dropped, '
+                           '{} open and {} non-manifold edges left\n'.format(
+                               *[stats.counts.get(name, 0) for name in (
+                                   'degenerate triangles', 'duplicate triangles',
+                                   'open edges', 'non-manifold edges')]))
+        if args.stats or args.stats_json:
+            measured[source] = stats.as_dict()
+            if args.stats:
+                messages.write(stats.report())
+
+    # entries of objects not converted this time are stale, unless something failed
+    if triangle_cache is not None and not ret:
+        messages.write('Removed {} stale cache entries\n'.format(triangle_cache.evict()))
+
+    if args.stats_json:
+        with open(args.stats_json, 'w') as f:
+            json.dump(measured, f, indent=2)
+
     return ret
@@ -10,6 +10,12 @@ class CityGMLInputError(CityGMLError):
     """
 
 
+class CityGMLCoordinatesError(CityGMLError):
+    """
+    Exception indicating coordinates in the CityGML file are malformed
+    """
+
+
 class PlaneError(Exception):
     """
     Base exception indicating something went wrong with Plane class
@@ -0,0 +1,160 @@
+import numpy
+
+from . import output
+from . import repair
+
+
+class IndexedMeshFile(object):
+    """
+    Base class representing a file storing a mesh as a list of vertices
+    and a list of faces indexing them
+
+    Identical vertices are welded to one, so shared vertices are stored only once.
+    The file is written when leaving the with statement.
+    Use within the with statement
+    """
+
+    def __init__(self, filename, tolerance=None, stats=None, transform=None):
+        """
+        Saves the filename and the welding tolerance
+
+        Instead of a filename, '-' for the standard output or a binary file object can be given.
+        Files named .gz, .bz2 or .xz are compressed on the fly.
+        With a tolerance, vertices closer than that are welded (see repair.weld_points()),
+        faces that collapse because of that are dropped.
+        If stats are given, the writing time and number of written triangles are added to them.
+        If a transform.Transform is given, triangles are transformed before being written
+        """
+        self.filename = filename
+        self.tolerance = tolerance
+        self.stats = stats
+        self.transform = transform
+
+    def __enter__(self):
+        """
+        Prepares empty lists of vertices and faces
+        """
+        self._vertices = []
+        self._faces = []
+        self._size = 0
+        return self
+
+    def write_triangles(self, triangles):
+        """
+        Adds triangles to the mesh
+
+        Vertices of the triangles are welded right away,
+        vertices shared with previously added triangles are welded when the file is written
+        """
+        if self.stats is not None:
+            self.stats.lap()
+        if self.transform is not None:
+            triangles = self.transform.apply(triangles)
+        vertices, faces = repair.weld(triangles, self.tolerance)
+        self._vertices.append(vertices)
+        self._faces.append(faces + self._size)
+        self._size += len(vertices)
+        if self.stats is not None:
+            self.stats.lap('weld')
+
+    def weld(self):
+        """
+        Weld the vertices of all the added triangles, drop faces that collapse
+        because of that and save them as (M, 3) vertices and (N, 3) faces arrays
+        """
+        vertices = numpy.vstack(self._vertices) if self._vertices else numpy.empty((0, 3))
+        faces = numpy.vstack(self._faces) if self._faces else numpy.empty((0, 3), numpy.intp)
+        self.vertices, indexes = repair.weld_points(vertices, self.tolerance)
+        faces = indexes[faces]
+        a, b, c = faces[:, 0], faces[:, 1], faces[:, 2]
+        self.faces = faces[(a != b) & (b != c) & (c != a)]
+        self._vertices, self._faces = [], []
+
+    def __exit__(self, type, value, traceback):
+        """
+        Write the mesh to the file
+        """
+        if self.stats is not None:
+            self.stats.lap()
+        self.weld()
+        if self.stats is not None:
+            self.stats.lap('weld')
+            self.stats.count('written triangles', len(self.faces))
+            self.stats.count('written vertices', len(self.vertices))
+        f, owned = output.open_output(self.filename)
+        try:
+            self._write(f)
+        finally:
+            if owned:
+                f.close()
+            else:
+                f.flush()
+        if self.stats is not None:
+            self.stats.lap('write')
+
+    def _write(self, f):
+        """
+        Write the vertices and faces to the given binary file, implemented by subclasses
+        """
+        raise NotImplementedError
+
+
+class ObjFile(IndexedMeshFile):
+    """
+    Class representing a Wavefront OBJ file
+
+    Use within the with statement
+    """
+
+    # how many lines to format at once
+    chunk = 4096
+
+    def _write(self, f):
+        """
+        Write vertices and faces as v and f lines
+        """
+        f.write(b'# citygml2stl\n')
+        vertices = self.vertices
+        for start in range(0, len(vertices), ObjFile.chunk):
+            f.write(''.join('v {} {} {}\n'.format(*vertex)
+                            for vertex in vertices[start:start + ObjFile.chunk].tolist())
+                    .encode('ascii'))
+        faces = self.faces
+        for start in range(0, len(faces), ObjFile.chunk):
+            # OBJ indices start at 1
+            f.write(''.join('f {} {} {}\n'.format(*face)
+                            for face in (faces[start:start + ObjFile.chunk] + 1).tolist())
+                    .encode('ascii'))
+
+
+class PlyFile(IndexedMeshFile):
+    """
+    Class representing a binary little endian PLY file
+
+    Use within the with statement
+    """
+
+    header = '''ply
+format binary_little_endian 1.0
+comment citygml2stl
+element vertex {}
+property double x
+property double y
+property double z
+element face {}
+property list uchar int vertex_indices
+end_header
+'''
+
+    face = numpy.dtype([('size', '<u1'), ('indices', '<i4', (3,))])
+
+    def _write(self, f):
+        """
+        Write the header, vertices and faces in bulk
+        """
+        f.write(PlyFile.header.format(len(self.vertices), len(self.faces)).encode('ascii'))
+        f.write(self.vertices.astype('<f8').tobytes())
+        records = numpy.empty(len(self.faces), dtype=PlyFile.face)
+        records['size'] = 3
+        records['indices'] = self.faces
+        f.write(records.tobytes())
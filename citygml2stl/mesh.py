@@ -0,0 +1,142 @@
+import numpy
+
+
+class TriangleMesh(object):
+    """
+    Class representing a list of triangles stored in one contiguous (N, 3, 3) float64 array
+
+    It can be used as a list of triangles (len, iteration, indexing, +=),
+    writers use the array directly without converting it to Python objects.
+    """
+
+    def __init__(self, triangles=None):
+        """
+        Initialize the mesh, optionally with given triangles
+        """
+        self._data = numpy.empty((0, 3, 3))
+        self._size = 0
+        if triangles is not None:
+            self.extend(triangles)
+
+    @classmethod
+    def from_array(cls, array):
+        """
+        Construct a mesh from an (N, 3, 3) array without copying it
+        """
+        mesh = cls()
+        mesh._data = numpy.asarray(array, dtype=numpy.float64).reshape(-1, 3, 3)
+        mesh._size = len(mesh._data)
+        return mesh
+
+    @property
+    def array(self):
+        """
+        The (N, 3, 3) array of triangles, a view, not a copy
+        """
+        return self._data[:self._size]
+
+    def _reserve(self, size):
+        """
+        Make sure there is room for size triangles, growing the capacity at least twice
+        """
+        if size <= len(self._data):
+            return
+        data = numpy.empty((max(size, 2 * len(self._data), 16), 3, 3))
+        data[:self._size] = self.array
+        self._data = data
+
+    def append(self, triangle):
+        """
+        Append one triangle (3 vertices of 3 coordinates)
+        """
+        self._reserve(self._size + 1)
+        self._data[self._size] = triangle
+        self._size += 1
+
+    def extend(self, triangles):
+        """
+        Append triangles from another mesh, an array or any iterable of triangles
+        """
+        if isinstance(triangles, TriangleMesh):
+            triangles = triangles.array
+        elif not isinstance(triangles, numpy.ndarray):
+            triangles = list(triangles)
+        triangles = numpy.asarray(triangles, dtype=numpy.float64).reshape(-1, 3, 3)
+        self._reserve(self._size + len(triangles))
+        self._data[self._size:self._size + len(triangles)] = triangles
+        self._size += len(triangles)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """
+        Iterate the triangles as lists of lists of coordinates
+        """
+        return iter(self.array.tolist())
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __iadd__(self, triangles):
+        self.extend(triangles)
+        return self
+
+    def __add__(self, triangles):
+        mesh = TriangleMesh(self)
+        mesh.extend(triangles)
+        return mesh
+
+    def __eq__(self, other):
+        if isinstance(other, TriangleMesh):
+            other = other.array
+        else:
+            other = numpy.asarray(list(other), dtype=numpy.float64).reshape(-1, 3, 3)
+        return self.array.shape == other.shape and bool((self.array == other).all())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getstate__(self):
+        # only pickle the used part of the array
+        return self.array.copy()
+
+    def __setstate__(self, state):
+        self._data = state
+        self._size = len(state)
+
+    def __repr__(self):
+        return '<TriangleMesh of {} triangles>'.format(self._size)
+
+
+def _cross(triangles):
+    """
+    Cross products of the edges of an (N, 3, 3) array of triangles by the right hand rule,
+    their sizes are twice the areas of the triangles
+    """
+    u = triangles[:, 1] - triangles[:, 0]
+    v = triangles[:, 2] - triangles[:, 0]
+    return u[:, [1, 2, 0]] * v[:, [2, 0, 1]] - u[:, [2, 0, 1]] * v[:, [1, 2, 0]]
+
+
+def normals(triangles):
+    """
+    Compute unit normal vectors of an (N, 3, 3) array of triangles by the right hand rule,
+    return an (N, 3) array, with zero vectors for triangles without any area
+    """
+    cross = _cross(numpy.asarray(triangles, dtype=numpy.float64).reshape(-1, 3, 3))
+    sizes = numpy.sqrt((cross * cross).sum(axis=1))
+    sizes[sizes == 0] = 1
+    # adding 0.0 turns -0.0 to 0.0
+    return cross / sizes[:, None] + 0.0
+
+
+def orient(triangles, directions):
+    """
+    Reverse the triangles of an (N, 3, 3) array whose vertices don't go counter-clockwise
+    around the given directions (an (N, 3) array or one vector for all the triangles),
+    in place, return the array
+    """
+    reverse = (_cross(triangles) * directions).sum(axis=1) < 0
+    triangles[reverse] = triangles[reverse][:, ::-1]
+    return triangles
@@ -0,0 +1,88 @@
+import bz2
+import gzip
+import io
+import os
+import sys
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+
+# size of write buffers, large enough to keep writing I/O bound rather than syscall bound
+BUFFER = 1024 * 1024
+
+
+def _gzip(filename):
+    return gzip.GzipFile(filename, 'wb', compresslevel=6)
+
+
+def _bz2(filename):
+    return bz2.BZ2File(filename, 'wb')
+
+
+def _xz(filename):
+    if lzma is None:
+        raise IOError('Writing .xz files needs the lzma module')
+    return lzma.LZMAFile(filename, 'wb')
+
+
+# extensions of compressed files and functions opening them for writing
+compressions = {
+    '.gz': _gzip,
+    '.bz2': _bz2,
+    '.xz': _xz,
+}
+
+
+def strip_compression(filename):
+    """
+    Return the filename without the extension of a compression, if any
+    """
+    base, extension = os.path.splitext(filename)
+    if extension in compressions:
+        return base
+    return filename
+
+
+def stdout():
+    """
+    Return the standard output as a binary file object
+    """
+    return getattr(sys.stdout, 'buffer', sys.stdout)
+
+
+def open_output(target):
+    """
+    Open the given output target for binary writing
+
+    The target is either a filename (compressed on the fly by its extension: .gz, .bz2 or .xz),
+    '-' for the standard output or an already open binary file object.
+    Return the file object and whether it is owned (should be closed by the caller)
+    """
+    if hasattr(target, 'write'):
+        return target, False
+    if target == '-':
+        return stdout(), False
+    extension = os.path.splitext(target)[1]
+    if extension in compressions:
+        return compressions[extension](target), True
+    return io.open(target, 'wb', buffering=BUFFER), True
+
+
+def is_seekable(f):
+    """
+    Whether it is possible to seek back in the given file object opened for writing
+
+    Compressed files report themselves as seekable, but can only seek forward when writing
+    """
+    compressed = [gzip.GzipFile, bz2.BZ2File]
+    if lzma is not None:
+        compressed.append(lzma.LZMAFile)
+    if isinstance(f, tuple(compressed)):
+        return False
+    try:
+        return f.seekable()
+    except (AttributeError, IOError, ValueError):
+        return False
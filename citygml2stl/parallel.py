@@ -0,0 +1,106 @@
+import collections
+import multiprocessing
+
+from lxml import etree
+
+from . import polygons
+from . import stats as statistics
+
+
+def _triangulate_serialized(batch, measure=False, merge=None, lod=None):
+    """
+    Triangulate a batch of serialized city objects, runs in a worker process
+
+    Return a list of lists of triangles and stats of the worker (None unless measure is set)
+    """
+    stats = statistics.Stats() if measure else None
+    results = []
+    for obj in batch:
+        obj = etree.fromstring(obj)
+        if stats is not None:
+            stats.lap('deserialize')
+        results.append(polygons.object2triangles(obj, stats, merge, lod=lod))
+    return results, stats
+
+
+def _batches(objects, size):
+    """
+    Serialize city objects and group them into lists of the given size
+
+    Objects are serialized as soon as they are read, so streamed elements can be freed
+    """
+    batch = []
+    for obj in objects:
+        batch.append(etree.tostring(obj))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def triangulate_batches(batches, workers=None, stats=None, merge=None, lod=None):
+    """
+    Triangulate batches of serialized city objects in a pool of worker processes
+
+    Yields a list of lists of triangles for every batch, in the same order as the batches.
+    Only a few batches per worker are in flight at once, so batches
+    from a streaming reader are not read much ahead of the results.
+    If workers is None, the number of CPUs is used, with 1 worker no pool is used at all.
+    If stats are given, stats from the workers are merged to them.
+    If merge is given, coplanar polygons are merged with that tolerance before triangulation.
+    If lod is given, only the geometry in that level of detail is triangulated.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    def collect(results, worker_stats):
+        if stats is not None:
+            stats.merge(worker_stats)
+        return results
+
+    if workers < 2:
+        for batch in batches:
+            yield collect(*_triangulate_serialized(batch, stats is not None, merge, lod))
+        return
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(pool.apply_async(_triangulate_serialized,
+                                            (batch, stats is not None, merge, lod)))
+            if len(pending) >= workers * 2:
+                yield collect(*pending.popleft().get())
+        while pending:
+            yield collect(*pending.popleft().get())
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def triangulate_objects(objects, workers=None, chunksize=8, stats=None, merge=None,
+                        lod=None):
+    """
+    Triangulate given city objects in a pool of worker processes
+
+    Yields lists of triangles of the objects in the same order as the objects were given.
+    lxml elements cannot be pickled, so the objects are serialized to XML
+    and sent to the workers in batches of chunksize objects, see triangulate_batches().
+    If workers is None, the number of CPUs is used, with 1 worker no pool is used at all.
+    If stats are given, stats from the workers are merged to them.
+    If merge is given, coplanar polygons are merged with that tolerance before triangulation.
+    If lod is given, only the geometry in that level of detail is triangulated.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers < 2:
+        for obj in objects:
+            yield polygons.object2triangles(obj, stats, merge, lod=lod)
+        return
+
+    for results in triangulate_batches(_batches(objects, chunksize), workers, stats,
+                                       merge, lod):
+        for triangles in results:
+            yield triangles
@@ -0,0 +1,147 @@
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import parallel
+
+
+# marks the end of a queue
+_DONE = object()
+
+# how often blocked stages check whether the pipeline was stopped, in seconds
+_POLL = 0.1
+
+
+class _Stage(threading.Thread):
+    """
+    Thread running one stage of the pipeline, remembering the exception it failed with
+    """
+
+    def __init__(self, target, stop, name):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.target = target
+        self.stop = stop
+        self.error = None
+
+    def run(self):
+        try:
+            self.target()
+        except BaseException as e:
+            self.error = e
+            self.stop.set()
+
+
+def _put(q, item, stop):
+    """
+    Put item to the bounded queue, waiting for a free slot until the pipeline is stopped
+
+    Return False if it was stopped
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    """
+    Yield items from the queue until its end or until the pipeline is stopped
+    """
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=_POLL)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def convert(objects, ofile, workers=None, chunksize=8, queue_size=4, stats=None, merge=None,
+            lod=None):
+    """
+    Triangulate given city objects and write them to an opened mesh file in a pipeline
+
+    Reading (and serializing) the objects, triangulating them and writing the triangles
+    run concurrently: the reader and the writer in their own threads,
+    the triangulation in a pool of worker processes (see parallel.triangulate_batches()).
+    The stages are connected by queues of at most queue_size batches of chunksize objects,
+    a stage waits when the next one is behind, so only a few batches are held in memory.
+    Triangles are written in the same order as the objects were given.
+    ofile is anything with a write_triangles() method, e.g. stl.StlFile.
+    If any stage fails, the others are stopped and its exception is raised.
+    If workers is None, the number of CPUs is used, with 1 worker the triangulation
+    runs in the calling thread.
+    If stats are given, time spent waiting for the other stages and stats from the workers
+    are added to them. The reader and the writer run in other threads,
+    so they must not be given the same stats.
+    If merge is given, coplanar polygons are merged with that tolerance before triangulation.
+    If lod is given, only the geometry in that level of detail is triangulated.
+    Return the number of triangulated objects.
+    """
+    stop = threading.Event()
+    read = queue.Queue(queue_size)
+    write = queue.Queue(queue_size)
+
+    def reader():
+        try:
+            for batch in parallel._batches(objects, chunksize):
+                if not _put(read, batch, stop):
+                    return
+            _put(read, _DONE, stop)
+        finally:
+            # release the input file when stopped early
+            close = getattr(objects, 'close', None)
+            if close is not None:
+                close()
+
+    def writer():
+        for results in _get(write, stop):
+            for triangles in results:
+                ofile.write_triangles(triangles)
+
+    def batches():
+        for batch in _get(read, stop):
+            if stats is not None:
+                stats.lap('waiting for objects')
+            yield batch
+
+    stages = [_Stage(reader, stop, 'citygml2stl reader'),
+              _Stage(writer, stop, 'citygml2stl writer')]
+    for stage in stages:
+        stage.start()
+    number = 0
+    triangulated = parallel.triangulate_batches(batches(), workers, stats, merge, lod)
+    try:
+        if stats is not None:
+            stats.lap()
+        for results in triangulated:
+            if stats is not None:
+                stats.lap('waiting for triangles')
+            if not _put(write, results, stop):
+                break
+            if stats is not None:
+                stats.lap('waiting for writer')
+            number += len(results)
+        else:
+            _put(write, _DONE, stop)
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        triangulated.close()
+        for stage in stages:
+            stage.join()
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
+    if stats is not None:
+        stats.count('pipelined objects', number)
+    return number
@@ -1,8 +1,13 @@
+import collections
+import math
 import operator
 
+import numpy
 import p2t
+from lxml import etree
 
 from . import exceptions
+from . import mesh
 
 
 class Polygons(object):
@@ -10,13 +15,148 @@ class Polygons(object):
     Class representing a set of polygons
     """
     gml = 'http://www.opengis.net/gml'
+    xlink = 'http://www.w3.org/1999/xlink'
+
+    # precompiled queries
+    _polygons = etree.ETXPath('.//{{{}}}Polygon'.format(gml))
+    _ids = etree.XPath('descendant-or-self::*[@gml:id]', namespaces={'gml': gml})
+    _hrefs = etree.XPath('.//*[@xlink:href]', namespaces={'xlink': xlink})
+    _geometries = etree.XPath('.//gml:Polygon | .//*[@xlink:href]',
+                              namespaces={'gml': gml, 'xlink': xlink})
+    _exterior = etree.ETXPath('(.//{{{}}}exterior)[1]'.format(gml))
+    _interiors = etree.ETXPath('.//{{{}}}interior'.format(gml))
+    _poslists = etree.ETXPath('.//{{{}}}posList'.format(gml))
+    _poses = etree.ETXPath('.//{{{}}}pos'.format(gml))
+    _coordinates = etree.ETXPath('.//{{{0}}}posList | .//{{{0}}}pos'.format(gml))
+    # lodNSolid, lodNMultiSurface, lodNGeometry... of any CityGML module
+    _lods = etree.XPath("descendant::*[starts-with(local-name(), 'lod') and "
+                        "string-length(local-name()) > 4 and "
+                        "translate(substring(local-name(), 4, 1), '0123456789', '') = '']")
+    lod_policies = ('highest', 'lowest')
 
     @classmethod
-    def extract_polygons(cls, obj):
+    def index_ids(cls, element):
         """
-        Extract a list of polygons from given object
+        Gets a dictionary of gml:id to elements of the given element and its descendants
+        """
+        key = '{{{}}}id'.format(cls.gml)
+        return dict((e.get(key), e) for e in cls._ids(element))
+
+    @classmethod
+    def lod_branches(cls, obj, lod):
+        """
+        Gets a list of elements of given object holding its geometry in the given level of detail
+        (lodNSolid, lodNMultiSurface, lodNGeometry...)
+
+        lod is a number or one of lod_policies: 'highest' or 'lowest' for the highest
+        or the lowest level of detail with some polygons.
+        Return None if the object has no such elements at all,
+        i.e. its geometry is not split by levels of detail.
+        """
+        levels = collections.defaultdict(list)
+        for branch in cls._lods(obj):
+            levels[int(etree.QName(branch).localname[3])].append(branch)
+        if not levels:
+            return None
+        if lod in cls.lod_policies:
+            for level in sorted(levels, reverse=lod == 'highest'):
+                branches = [branch for branch in levels[level] if cls._has_geometry(branch)]
+                if branches:
+                    return branches
+            return []
+        return levels.get(int(lod), [])
+
+    @classmethod
+    def _has_geometry(cls, element):
+        """
+        Whether there are any polygons or references to geometry in (or at) the element
+        """
+        return element.get('{{{}}}href'.format(cls.xlink)) is not None or \
+            bool(cls._geometries(element))
+
+    @classmethod
+    def has_lod(cls, obj, lod):
+        """
+        Whether given object has any geometry in the given level of detail (see lod_branches()),
+        objects with geometry not split by levels of detail always have, as with lod None
+        """
+        if lod is None:
+            return True
+        branches = cls.lod_branches(obj, lod)
+        return branches is None or any(cls._has_geometry(branch) for branch in branches)
+
+    @classmethod
+    def extract_polygons(cls, obj, ids=None, unique=True, stats=None, lod=None):
         """
-        return obj.findall('.//{{{}}}Polygon'.format(cls.gml))
+        Extract a list of polygons from given object
+
+        Geometry reused by xlink:href="#id" references is resolved through ids,
+        a dictionary of gml:id to elements (see CityGML.ids), or through the gml:ids
+        inside the object if not given. If unique is set, a polygon present
+        more times (referenced or both inline and referenced) is only returned once.
+        References to missing or non GML elements and reference cycles are skipped
+        (and counted if stats are given).
+        If lod is given, only the geometry in that level of detail is extracted
+        (see lod_branches()), other levels are not searched at all.
+        """
+        branches = None if lod is None else cls.lod_branches(obj, lod)
+        if branches is None:
+            if not cls._hrefs(obj):
+                return cls._polygons(obj)
+            found = cls._geometries(obj)
+        else:
+            href = '{{{}}}href'.format(cls.xlink)
+            if not any(branch.get(href) is not None or cls._hrefs(branch) for branch in branches):
+                return [polygon for branch in branches for polygon in cls._polygons(branch)]
+            found = [element for branch in branches
+                     for element in ([branch] if branch.get(href) is not None
+                                     else cls._geometries(branch))]
+        if ids is None:
+            ids = cls.index_ids(obj)
+        polygons = []
+        cls._resolve(found, ids, unique, set(), [], polygons, stats)
+        return polygons
+
+    @classmethod
+    def _resolve(cls, elements, ids, unique, seen, path, polygons, stats=None):
+        """
+        Append polygons of the given polygons and referencing elements to polygons,
+        in document order, following references
+
+        seen is a set of polygons found so far, path is a list of gml:ids being resolved
+        """
+        href = '{{{}}}href'.format(cls.xlink)
+        for found in elements:
+            target = found.get(href)
+            if target is None:
+                if not (unique and found in seen):
+                    seen.add(found)
+                    polygons.append(found)
+                elif stats is not None:
+                    stats.count('shared polygons')
+                continue
+            target = target.strip()
+            referenced = ids.get(target[1:]) if target.startswith('#') else None
+            if referenced is None or etree.QName(referenced).namespace != cls.gml:
+                if stats is not None:
+                    stats.count('unresolved xlinks')
+                continue
+            if target in path:
+                if stats is not None:
+                    stats.count('xlink cycles')
+                continue
+            if stats is not None:
+                stats.count('xlinks')
+            if etree.QName(referenced).localname == 'Polygon':
+                if not (unique and referenced in seen):
+                    seen.add(referenced)
+                    polygons.append(referenced)
+                elif stats is not None:
+                    stats.count('shared polygons')
+                continue
+            path.append(target)
+            cls._resolve(cls._geometries(referenced), ids, unique, seen, path, polygons, stats)
+            path.pop()
 
     @classmethod
     def exterior_interiors(cls, polygon):
@@ -24,115 +164,602 @@ class Polygons(object):
         Extracts exterior rings and all interior rings from a polygon
         """
         # Only one exterior ring
-        exterior = polygon.find('.//{{{}}}exterior'.format(cls.gml))
+        exterior = cls._exterior(polygon)
+        exterior = exterior[0] if exterior else None
         # But any number of interior rings (even zero)
-        interiors = polygon.findall('.//{{{}}}interior'.format(cls.gml))
+        interiors = cls._interiors(polygon)
         return exterior, interiors
 
     @classmethod
-    def ring_to_points(cls, ring):
+    def srs_dimension(cls, element):
         """
-        Gets a list of points from given ring
+        Gets the number of coordinates per point of the given element
+
+        The srsDimension attribute might be set on the element itself or on any of its ancestors,
+        when it's not set at all, 3 is assumed
         """
-        ret = []
+        while element is not None:
+            dimension = element.get('srsDimension')
+            if dimension is not None:
+                return int(dimension)
+            element = element.getparent()
+        return 3
 
-        points = ring.findall('.//{{{}}}posList'.format(cls.gml)) or \
-            ring.findall('.//{{{}}}pos'.format(cls.gml))
+    @classmethod
+    def coordinates_to_array(cls, element):
+        """
+        Converts the text of a posList or pos element to an array of 3D points
+        """
+        text = element.text
+        if not text or text.isspace():
+            return numpy.empty((0, 3))
+        try:
+            coords = numpy.fromstring(text, sep=' ')
+        except ValueError:
+            coords = None
+        # older numpy stops at the first malformed number with just a warning
+        if coords is None or len(coords) != len(text.split()):
+            raise exceptions.CityGMLCoordinatesError(
+                'Malformed coordinates: {}'.format(text.strip()[:100]))
+
+        dimension = cls.srs_dimension(element)
+        if dimension not in (2, 3):
+            raise exceptions.CityGMLCoordinatesError(
+                'Unsupported srsDimension {}'.format(dimension))
+        if len(coords) % dimension:
+            raise exceptions.CityGMLCoordinatesError(
+                'Number of coordinates {} is not divisible by {}'.format(len(coords), dimension))
+
+        coords = coords.reshape(-1, dimension)
+        if dimension == 2:
+            # 2D points lay on the z = 0 plane
+            coords = numpy.hstack((coords, numpy.zeros((len(coords), 1))))
+        return coords
 
-        for point in points:
-            coords = point.text.split()
-            for i in range(0, len(coords), 3):
-                ret.append((float(coords[i]),
-                            float(coords[i + 1]),
-                            float(coords[i + 2])))
+    @classmethod
+    def ring_to_array(cls, ring):
+        """
+        Gets an (N, 3) array of points from given ring
+        """
+        points = cls._poslists(ring) or cls._poses(ring)
 
-        return ret
+        if len(points) == 1:
+            return cls.coordinates_to_array(points[0])
+        if not points:
+            return numpy.empty((0, 3))
+        return numpy.vstack([cls.coordinates_to_array(point) for point in points])
+
+    @classmethod
+    def ring_to_points(cls, ring):
+        """
+        Gets a list of points (tuples) from given ring
+        """
+        return [tuple(point) for point in cls.ring_to_array(ring).tolist()]
+
+    @classmethod
+    def bounding_box(cls, obj, lod=None, ids=None):
+        """
+        Gets the 3D bounding box (minx, miny, minz, maxx, maxy, maxz) of all coordinates
+        from given object, None if there are no coordinates
+
+        If lod is given, only the polygons in that level of detail are used
+        (see extract_polygons(), references are resolved through ids)
+        """
+        if lod is not None and cls.lod_branches(obj, lod) is not None:
+            elements = [e for polygon in cls.extract_polygons(obj, ids, lod=lod)
+                        for e in cls._coordinates(polygon)]
+        else:
+            elements = cls._coordinates(obj)
+        arrays = [cls.coordinates_to_array(e) for e in elements]
+        arrays = [a for a in arrays if len(a)]
+        if not arrays:
+            return None
+        points = numpy.vstack(arrays)
+        return tuple(points.min(axis=0).tolist() + points.max(axis=0).tolist())
 
     @classmethod
     def epoints_ipoints(cls, polygon):
         """
-        Gets lists of exterior and interior points
+        Gets arrays of exterior and interior points
         """
         exterior, interiors = cls.exterior_interiors(polygon)
-        epoints = cls.ring_to_points(exterior)
+        epoints = cls.ring_to_array(exterior)
         ipoints = []
         for ring in interiors:
-            ipoints.append(cls.ring_to_points(ring))
+            ipoints.append(cls.ring_to_array(ring))
         return epoints, ipoints
 
     @classmethod
-    def preprocess(cls, points):
+    def preprocess(cls, points, tolerance=None):
         """
         Remove duplicte points from list and check if all the points aren't on the same line
         If they are, return empty list
 
-        Unfortunately p2t.Points are not comparable, so it is done coordinate by coordinate
+        Unfortunately p2t.Points are not comparable nor hashable, so the points are
+        deduplicated by a set of their coordinate tuples, keeping the first occurrence.
+        If tolerance is given, points are considered the same if they snap to the same
+        grid cell of that size.
 
         It is crucial to deduplicate 2D points and not 3D points in case 2 different 3D points
         result to the same 2D point, which is possible due to float limitations
         """
         uniq = []
+        seen = set()
         is_line = True
 
         for point in points:
-            is_uniq = True
-            for candidate in uniq:
-                if point.x == candidate.x and point.y == candidate.y:
-                    is_uniq = False
-                    break
-
-            if is_uniq:
-                uniq.append(point)
-
-                if is_line:
-                    if len(uniq) > 2:
-                        if not line.is_on(point):
-                            is_line = False
-                    elif len(uniq) == 2:
-                        line = Line(*uniq)
+            if tolerance:
+                key = (round(point.x / tolerance), round(point.y / tolerance))
+            else:
+                key = (point.x, point.y)
+            if key in seen:
+                continue
+            seen.add(key)
+            uniq.append(point)
+
+            if is_line:
+                if len(uniq) > 2:
+                    if not line.is_on(point):
+                        is_line = False
+                elif len(uniq) == 2:
+                    line = Line(*uniq)
 
         if is_line:
             return []
         return uniq
 
     @classmethod
-    def triangulate(cls, polygon):
+    def triangulate(cls, polygon, stats=None):
         """
-        Triangulate the given polygon
+        Triangulate the given polygon, return a TriangleMesh
+
+        The triangles keep the orientation of the exterior ring of the polygon (right hand rule).
+        If stats are given, time of the stages and counts of rings, holes
+        and triangles are added to them
         """
+        if stats is not None:
+            stats.lap()
         epoints, ipoints = cls.epoints_ipoints(polygon)
-        plane = Plane(epoints)
+        if stats is not None:
+            stats.lap('coordinates')
+            stats.count('rings', 1 + len(ipoints))
+            stats.count('holes', len(ipoints))
+        plane = Plane.fit(epoints)
+        if stats is not None:
+            stats.lap('plane')
+        return cls.triangulate_2d(plane, plane.array_to2D(epoints),
+                                  [plane.array_to2D(hole) for hole in ipoints], stats)
 
-        epoints = cls.preprocess(map(plane.to2D, epoints))
+    @classmethod
+    def triangulate_2d(cls, plane, epoints, ipoints, stats=None):
+        """
+        Triangulate a polygon given by lists of poly2tri points of its exterior and interior rings
+        projected to 2D by the given plane, return a TriangleMesh
+
+        The triangles go counter-clockwise around the normal vector of the plane
+        """
+        points2d = cls._triangulate_points(epoints, ipoints, stats)
+        triangles = mesh.orient(plane.array_to3D(points2d).reshape(-1, 3, 3),
+                                [plane.a, plane.b, plane.c])
+        triangles = mesh.TriangleMesh.from_array(triangles)
+        if stats is not None:
+            stats.lap('to3D')
+        return triangles
+
+    @classmethod
+    def _triangulate_points(cls, epoints, ipoints, stats=None):
+        """
+        Triangulate a polygon given by lists of poly2tri points of its exterior and interior rings,
+        return an (N * 3, 2) array of 2D vertices of the triangles
+        """
+        epoints = cls.preprocess(epoints)
         if not epoints:
-            return []
+            if stats is not None:
+                stats.lap('preprocess')
+                stats.count('skipped polygons')
+            return numpy.empty((0, 2))
         cdt = p2t.CDT(epoints)
 
         for hole in ipoints:
-            hole = cls.preprocess(map(plane.to2D, hole))
+            hole = cls.preprocess(hole)
             if hole:
                 cdt.add_hole(hole)
+            elif stats is not None:
+                stats.count('skipped holes')
+        if stats is not None:
+            stats.lap('preprocess')
 
         triangles2d = cdt.triangulate()
-        return [list(map(plane.to3D, [t.a, t.b, t.c])) for t in triangles2d]
+        if stats is not None:
+            stats.lap('triangulate')
+        points2d = numpy.array([(t.a.x, t.a.y, t.b.x, t.b.y, t.c.x, t.c.y) for t in triangles2d])
+        if stats is not None:
+            stats.count('triangles', len(triangles2d))
+        return points2d.reshape(-1, 2)
+
+    @classmethod
+    def triangulate_all(cls, obj, stats=None, merge=None, ids=None, unique=True, lod=None):
+        """
+        Triangulate all polygons from given object, return a TriangleMesh
+
+        Polygons a plane cannot be constructed from are skipped
+        (and counted as degenerate polygons if stats are given).
+        If merge is given, adjacent coplanar polygons are merged first, see triangulate_merged().
+        References to shared geometry are resolved with ids and unique,
+        only the geometry in the level of detail lod is used if given, see extract_polygons()
+        """
+        polygons = cls.extract_polygons(obj, ids, unique, stats, lod)
+        if stats is not None:
+            stats.count('objects')
+            stats.count('polygons', len(polygons))
+        if merge is not None:
+            return cls.triangulate_merged(polygons, merge, stats)
+        if stats is not None:
+            stats.lap()
+        rings = [cls.epoints_ipoints(polygon) for polygon in polygons]
+        if stats is not None:
+            stats.lap('coordinates')
+            holes = sum(len(ipoints) for epoints, ipoints in rings)
+            stats.count('rings', len(rings) + holes)
+            stats.count('holes', holes)
+        return cls.triangulate_rings(rings, stats)
 
     @classmethod
-    def triangulate_all(cls, obj):
+    def triangulate_rings(cls, polygons, stats=None):
+        """
+        Triangulate polygons given as pairs of an (N, 3) array of the exterior ring
+        and a list of arrays of the interior rings, return a TriangleMesh
+
+        Planes of all the polygons are fitted at once (see Planes), all the rings are
+        projected to 2D at once and all the triangles are lifted back to 3D at once.
+        The triangles keep the orientation of their exterior ring (right hand rule).
+        Polygons without a plane are skipped (and counted as degenerate polygons
+        if stats are given).
+        """
+        if stats is not None:
+            stats.lap()
+        planes = Planes([epoints for epoints, ipoints in polygons])
+        if stats is not None:
+            stats.lap('plane')
+            stats.count('degenerate polygons', int((~planes.valid).sum()))
+        valid = numpy.flatnonzero(planes.valid).tolist()
+        if not valid:
+            return mesh.TriangleMesh()
+
+        rings = [ring for i in valid for ring in [polygons[i][0]] + list(polygons[i][1])]
+        sizes = [len(ring) for ring in rings]
+        owners = numpy.repeat([i for i in valid for ring in range(1 + len(polygons[i][1]))], sizes)
+        points = planes.to2D(numpy.concatenate(rings), owners).tolist()
+        offsets = numpy.cumsum([0] + sizes).tolist()
+        rings = [[p2t.Point(x, y) for x, y in points[a:b]] for a, b in zip(offsets, offsets[1:])]
+        if stats is not None:
+            stats.lap('to2D')
+
+        parts = []
+        first = 0
+        for i in valid:
+            last = first + 1 + len(polygons[i][1])
+            parts.append(cls._triangulate_points(rings[first], rings[first + 1:last], stats))
+            first = last
+        owners = numpy.repeat(valid, [len(part) for part in parts])
+        triangles = planes.to3D(numpy.concatenate(parts), owners).reshape(-1, 3, 3)
+        triangles = mesh.orient(triangles, planes.normals[owners[::3]])
+        if stats is not None:
+            stats.lap('to3D')
+        return mesh.TriangleMesh.from_array(triangles)
+
+    @classmethod
+    def plane_key(cls, points, tolerance):
         """
-        Triangulate all polygons from given object
+        Gets a hashable key of the oriented plane of the given (N, 3) ring points
+        with the unit normal and the distance from origin quantized by tolerance,
+        None if the points don't form a plane
         """
-        triangles = []
-        for polygon in cls.extract_polygons(obj):
-            try:
-                triangles += cls.triangulate(polygon)
-            except exceptions.PlaneConstructionError:
-                pass
+        normal = numpy.array(Plane.newell(points))
+        size = numpy.sqrt(normal.dot(normal))
+        if not size:
+            return None
+        normal /= size
+        distance = -normal.dot(points.mean(axis=0))
+        return tuple(int(round(value / tolerance)) for value in normal.tolist() + [distance])
+
+    @classmethod
+    def triangulate_merged(cls, polygons, tolerance, stats=None):
+        """
+        Triangulate given polygons, merging adjacent coplanar ones first, return a TriangleMesh
+
+        Polygons are grouped by their oriented planes quantized by tolerance
+        (both the unit normal and the distance from origin), polygons of a group connected
+        by shared edges are merged to outlines with holes and each outline is triangulated once.
+        Polygons that cannot be merged cleanly (overlaps, touching corners...)
+        are triangulated one by one.
+        If stats are given, the number of triangles without merging is counted
+        as triangles before merging, estimated for the merged polygons (see _triangles_estimate()).
+        """
+        groups = collections.OrderedDict()
+        for polygon in polygons:
+            if stats is not None:
+                stats.lap()
+            rings = cls.epoints_ipoints(polygon)
+            if stats is not None:
+                stats.lap('coordinates')
+                stats.count('rings', 1 + len(rings[1]))
+                stats.count('holes', len(rings[1]))
+            key = cls.plane_key(rings[0], tolerance) if len(rings[0]) >= 3 else None
+            # polygons without a plane are not merged with anything
+            groups.setdefault(key if key is not None else id(polygon), []).append(rings)
+
+        triangles = mesh.TriangleMesh()
+        for group in groups.values():
+            single = group
+            if len(group) > 1:
+                merged, single = cls._triangulate_group(group, stats)
+                triangles += merged
+            if single:
+                before = len(triangles)
+                triangles += cls.triangulate_rings(single, stats)
+                if stats is not None:
+                    stats.count('triangles before merging', len(triangles) - before)
         return triangles
 
+    @classmethod
+    def _triangles_estimate(cls, rings):
+        """
+        Estimated number of triangles of a polygon given by (N, 3) arrays of its rings
+        when triangulated alone, without triangulating it
 
-def object2triangles(obj):
+        A constrained triangulation of n distinct vertices in 1 + h rings has n + 2h - 2 triangles,
+        it's only an estimate as preprocess() may still drop some of the vertices
+        """
+        epoints, ipoints = rings
+        counts = [len(set(map(tuple, ring.tolist()))) for ring in [epoints] + list(ipoints)]
+        return max(0, sum(counts) + 2 * (len(counts) - 1) - 2)
+
+    @classmethod
+    def _triangulate_group(cls, group, stats=None):
+        """
+        Merge and triangulate a group of coplanar polygons given by (N, 3) arrays of their rings
+
+        Return a TriangleMesh of the merged polygons and a list of polygons left to be
+        triangulated one by one
+        """
+        planes = Planes([epoints for epoints, ipoints in group])
+        if not planes.valid.any():
+            return mesh.TriangleMesh(), group
+        plane = planes[int(numpy.flatnonzero(planes.valid)[0])]
+        rings2d = []
+        for epoints, ipoints in group:
+            rings2d.append([list(map(tuple, numpy.delete(ring, plane.longest, axis=1).tolist()))
+                            for ring in [epoints] + list(ipoints)])
+
+        triangles = mesh.TriangleMesh()
+        single = []
+        for component in connected_polygons(rings2d):
+            outlines = None
+            if len(component) > 1:
+                outlines = merge_rings([rings2d[i] for i in component])
+            if stats is not None:
+                stats.lap('merge')
+            if outlines is None:
+                single += [group[i] for i in component]
+                continue
+            for exterior, holes in outlines:
+                triangles += cls.triangulate_2d(
+                    plane, [p2t.Point(*p) for p in exterior],
+                    [[p2t.Point(*p) for p in hole] for hole in holes], stats)
+            if stats is not None:
+                stats.count('merged polygons', len(component))
+                stats.count('merged outlines', len(outlines))
+                stats.count('triangles before merging', sum(
+                    cls._triangles_estimate(group[i]) for i in component))
+        return triangles, single
+
+
+def object2triangles(obj, stats=None, merge=None, ids=None, unique=True, lod=None):
     """Shortcut to triangulation method from Polygons class"""
-    return Polygons.triangulate_all(obj)
+    return Polygons.triangulate_all(obj, stats, merge, ids, unique, lod)
+
+
+def ring_area(ring):
+    """
+    Signed area of a 2D ring given by a list of points (without the closing point),
+    positive for counter-clockwise rings
+    """
+    area = 0.0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        area += x1 * y2 - x2 * y1
+    return area / 2
+
+
+def ring_contains(ring, point):
+    """
+    Whether the 2D point is inside the 2D ring (by the even-odd rule)
+    """
+    x, y = point
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
+
+
+def drop_collinear(ring, tolerance=1e-9):
+    """
+    Drops vertices of a 2D ring lying on the straight line between their neighbours
+
+    The tolerance is relative to the lengths of the neighbouring edges.
+    """
+    ring = list(ring)
+    i = 0
+    while i < len(ring) and len(ring) > 3:
+        (x0, y0), (x1, y1), (x2, y2) = ring[i - 1], ring[i], ring[(i + 1) % len(ring)]
+        ux, uy, vx, vy = x1 - x0, y1 - y0, x2 - x1, y2 - y1
+        if (abs(ux * vy - uy * vx) <= tolerance * math.hypot(ux, uy) * math.hypot(vx, vy) and
+                ux * vx + uy * vy > 0):
+            del ring[i]
+            i = max(i - 1, 0)
+        else:
+            i += 1
+    return ring
+
+
+def ring_edges(ring):
+    """
+    Gets a list of directed edges of a 2D ring, the closing point and repeated points are skipped
+    """
+    ring = [p for i, p in enumerate(ring) if p != ring[i - 1]]
+    return list(zip(ring, ring[1:] + ring[:1])) if len(ring) > 1 else []
+
+
+def connected_polygons(polygons):
+    """
+    Split 2D polygons (lists of rings, lists of 2D tuples) to groups connected by shared edges
+
+    Return a list of lists of indexes of the polygons
+    """
+    parents = list(range(len(polygons)))
+
+    def root(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    owners = {}
+    for i, rings in enumerate(polygons):
+        for ring in rings:
+            for start, end in ring_edges(ring):
+                edge = (start, end) if start < end else (end, start)
+                if edge in owners:
+                    parents[root(i)] = root(owners[edge])
+                else:
+                    owners[edge] = i
+
+    components = collections.OrderedDict()
+    for i in range(len(polygons)):
+        components.setdefault(root(i), []).append(i)
+    return list(components.values())
+
+
+# how many pairs of edges rings_intersect() tests at once, bounding its memory
+PAIRS = 65536
+
+
+def rings_intersect(rings):
+    """
+    Whether any two edges of the given 2D rings touch or cross, except for the following edges
+    of one ring sharing their vertex
+
+    Only the pairs of edges with overlapping bounding boxes are tested: the edges are sorted
+    by their minimal x and every edge is paired with the following ones starting before it ends
+    (sort and sweep), so for usual rings the check takes near-linear time.
+    """
+    edges = numpy.array([edge for ring in rings for edge in ring_edges(ring)],
+                        dtype=numpy.float64).reshape(-1, 2, 2)
+    lows, highs = edges.min(axis=1), edges.max(axis=1)
+    order = numpy.argsort(lows[:, 0], kind='mergesort')
+    edges, lows, highs = edges[order], lows[order], highs[order]
+    # edges after i starting before the end of i in x are paired with it
+    ends = numpy.searchsorted(lows[:, 0], highs[:, 0], side='right')
+    counts = ends - numpy.arange(len(edges)) - 1
+    totals = numpy.cumsum(counts)
+
+    def orientation(p, q, r):
+        return numpy.sign((q[:, 0] - p[:, 0]) * (r[:, 1] - p[:, 1]) -
+                          (q[:, 1] - p[:, 1]) * (r[:, 0] - p[:, 0]))
+
+    start = 0
+    while start < len(edges):
+        done = totals[start - 1] if start else 0
+        stop = max(start + 1, int(numpy.searchsorted(totals, done + PAIRS, side='right')))
+        sizes = counts[start:stop]
+        i = numpy.repeat(numpy.arange(start, stop), sizes)
+        firsts = numpy.repeat(numpy.cumsum(sizes) - sizes, sizes)
+        j = i + 1 + numpy.arange(len(i)) - firsts
+        start = stop
+        # the bounding boxes overlap in x already, check y
+        near = (lows[j, 1] <= highs[i, 1]) & (lows[i, 1] <= highs[j, 1])
+        i, j = i[near], j[near]
+        a, b, c, d = edges[i, 0], edges[i, 1], edges[j, 0], edges[j, 1]
+        # collinear edges only touch when their bounding boxes overlap, which they do
+        crossing = ((orientation(a, b, c) * orientation(a, b, d) <= 0) &
+                    (orientation(c, d, a) * orientation(c, d, b) <= 0))
+        # each vertex starts exactly one edge, so only following edges share a vertex
+        sharing = (a == d).all(axis=1) | (b == c).all(axis=1)
+        if (crossing & ~sharing).any():
+            return True
+    return False
+
+
+def merge_rings(polygons):
+    """
+    Merge 2D polygons sharing edges to outlines with holes
+
+    Polygons are given as lists of rings (lists of 2D tuples, exterior first).
+    Edges shared by two polygons cancel out and the rest is chained to new rings,
+    vertices left in the middle of straight edges are dropped.
+    Return a list of (exterior, holes) pairs, or None if the polygons cannot be merged cleanly:
+    when they overlap, touch only in a corner or the merged area doesn't match.
+    """
+    edges = set()
+    area = 0.0
+    for rings in polygons:
+        for i, ring in enumerate(rings):
+            ring = [start for start, end in ring_edges(ring)]
+            if len(ring) < 3:
+                if not i:
+                    return None
+                continue
+            ring_size = ring_area(ring)
+            if not ring_size:
+                return None
+            # exteriors counter-clockwise, holes clockwise
+            if (ring_size > 0) != (i == 0):
+                ring = ring[::-1]
+                ring_size = -ring_size
+            area += ring_size
+            for edge in zip(ring, ring[1:] + ring[:1]):
+                if (edge[1], edge[0]) in edges:
+                    edges.remove((edge[1], edge[0]))
+                elif edge in edges:
+                    return None
+                else:
+                    edges.add(edge)
+
+    following = {}
+    for start, end in edges:
+        if start in following:
+            return None
+        following[start] = end
+
+    rings = []
+    while following:
+        start, point = following.popitem()
+        ring = [start]
+        while point != start:
+            ring.append(point)
+            point = following.pop(point, None)
+            if point is None:
+                return None
+        rings.append(drop_collinear(ring))
+
+    areas = [ring_area(ring) for ring in rings]
+    if abs(sum(areas) - area) > 1e-6 * abs(area) or rings_intersect(rings):
+        return None
+
+    exteriors = [(size, ring) for size, ring in zip(areas, rings) if size > 0]
+    exteriors.sort(key=lambda pair: pair[0])
+    outlines = collections.OrderedDict((id(ring), (ring, [])) for size, ring in exteriors)
+    for size, ring in zip(areas, rings):
+        if size > 0:
+            continue
+        for exterior_size, exterior in exteriors:
+            if ring_contains(exterior, ring[0]):
+                outlines[id(exterior)][1].append(ring)
+                break
+        else:
+            return None
+    return list(outlines.values())
 
 
 class Plane(object):
@@ -192,6 +819,26 @@ class Plane(object):
             raise exceptions.PlaneConstructionError('All points form a line')
         return p, q, r, c
 
+    @classmethod
+    def from_coefficients(cls, a, b, c, d):
+        """
+        Construct the plane a * x + b * y + c * z + d = 0 from its coefficients
+        """
+        plane = cls.__new__(cls)
+        plane.a, plane.b, plane.c, plane.d = a, b, c, d
+        plane.longest = plane._longest()
+        return plane
+
+    @classmethod
+    def fit(cls, points):
+        """
+        Construct the plane fitted to an (N, 3) array of points of a ring by Newell's method
+
+        Unlike the constructor, all the points are used, so near-collinear starts
+        of the ring don't matter, raise an exception if the points don't form a plane
+        """
+        return Planes([numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)])[0]
+
     def _longest(self):
         """
         Returns an index of the longest normal vector part
@@ -207,6 +854,14 @@ class Plane(object):
         p = point[:self.longest] + point[self.longest+1:]
         return p2t.Point(*p)
 
+    def array_to2D(self, points):
+        """
+        Get a list of poly2tri points from an (N, 3) array of 3D points
+        by omitting the less significant coordinate of all of them at once
+        """
+        points = numpy.delete(points, self.longest, axis=1)
+        return [p2t.Point(x, y) for x, y in points.tolist()]
+
     def to3D(self, point):
         """
         Get a 3D point from a 2D point by recalculating the omitted less significant coordinate
@@ -221,6 +876,35 @@ class Plane(object):
             [pl[i] * po[i] for i in range(4) if i is not self.longest]) / pl[self.longest]
         return po[:3]
 
+    def array_to3D(self, points):
+        """
+        Get an (N, 3) array of 3D points from an (N, 2) array of 2D points
+        by recalculating the omitted less significant coordinate of all of them at once
+        """
+        pl = [self.a, self.b, self.c]
+        known = [i for i in range(3) if i != self.longest]
+        result = numpy.empty((len(points), 3))
+        result[:, known] = points
+        # the same as in to3D, e.g. x = -(y*b + z*c + 1*d) / a
+        result[:, self.longest] = -(pl[known[0]] * points[:, 0] + pl[known[1]] * points[:, 1] +
+                                    self.d) / pl[self.longest]
+        return result
+
+    @classmethod
+    def newell(cls, points):
+        """
+        Calculate the normal vector of a polygon from an (N, 3) array of its ring by Newell's method
+
+        The vector follows the right hand rule of the ring and its size is twice the area
+        """
+        p = numpy.asarray(points, dtype=numpy.float64)
+        # translate the points close to the origin for better precision
+        p = p - p.mean(axis=0)
+        q = numpy.roll(p, -1, axis=0)
+        return [((p[:, 1] - q[:, 1]) * (p[:, 2] + q[:, 2])).sum(),
+                ((p[:, 2] - q[:, 2]) * (p[:, 0] + q[:, 0])).sum(),
+                ((p[:, 0] - q[:, 0]) * (p[:, 1] + q[:, 1])).sum()]
+
     @classmethod
     def cross(cls, u, v):
         """
@@ -231,6 +915,96 @@ class Plane(object):
                 u[0] * v[1] - u[1] * v[0]]
 
 
+class Planes(object):
+    """
+    Class representing planes of many polygons fitted at once by Newell's method
+
+    Coefficients of all the planes are kept in arrays, so points of all the polygons
+    can be projected to 2D and back at once, see Plane for a single plane
+    """
+
+    # normal vectors shorter than this (relative to the squared size of the ring)
+    # mean the points form a line
+    tolerance = 1e-12
+
+    # indexes of the coordinates kept in 2D for each of the omitted ones
+    _kept = numpy.array([[1, 2], [0, 2], [0, 1]])
+
+    def __init__(self, rings):
+        """
+        Fit the planes to a list of (N, 3) arrays of points of rings
+
+        The normal vectors follow the right hand rule of the rings, planes of rings
+        with less than 3 points or forming a line are not valid
+        """
+        sizes = numpy.array([len(ring) for ring in rings], dtype=numpy.intp)
+        self.valid = sizes >= 3
+        self.normals = numpy.zeros((len(rings), 3))
+        centers = numpy.zeros((len(rings), 3))
+        used = numpy.flatnonzero(self.valid)
+        if len(used):
+            sizes = sizes[used]
+            points = numpy.concatenate([rings[i] for i in used]).astype(numpy.float64)
+            starts = numpy.concatenate(([0], numpy.cumsum(sizes)[:-1]))
+            center = numpy.add.reduceat(points, starts, axis=0) / sizes[:, None]
+            # translate the points close to the origin for better precision
+            p = points - numpy.repeat(center, sizes, axis=0)
+            following = numpy.arange(1, len(p) + 1)
+            following[starts + sizes - 1] = starts
+            q = p[following]
+            terms = numpy.empty_like(p)
+            terms[:, 0] = (p[:, 1] - q[:, 1]) * (p[:, 2] + q[:, 2])
+            terms[:, 1] = (p[:, 2] - q[:, 2]) * (p[:, 0] + q[:, 0])
+            terms[:, 2] = (p[:, 0] - q[:, 0]) * (p[:, 1] + q[:, 1])
+            normals = numpy.add.reduceat(terms, starts, axis=0)
+            spread = numpy.maximum.reduceat(numpy.abs(p).max(axis=1), starts)
+            lengths = numpy.sqrt((normals ** 2).sum(axis=1))
+            self.valid[used[lengths <= self.tolerance * spread ** 2]] = False
+            self.normals[used] = normals
+            centers[used] = center
+        self.d = -(self.normals * centers).sum(axis=1)
+        self.longest = numpy.abs(self.normals).argmax(axis=1)
+
+    def __len__(self):
+        return len(self.valid)
+
+    def __getitem__(self, index):
+        """
+        Gets the plane of the given polygon as a Plane, raise an exception if it's not valid
+        """
+        if not self.valid[index]:
+            raise exceptions.PlaneConstructionError('Points do not form a plane')
+        a, b, c = self.normals[index].tolist()
+        return Plane.from_coefficients(a, b, c, float(self.d[index]))
+
+    def to2D(self, points, owners):
+        """
+        Get an (N, 2) array of 2D points from an (N, 3) array of 3D points
+        of polygons given by an array of N indexes, by omitting the less significant
+        coordinate of each polygon's plane
+        """
+        kept = self._kept[self.longest[owners]]
+        return points[numpy.arange(len(points))[:, None], kept]
+
+    def to3D(self, points, owners):
+        """
+        Get an (N, 3) array of 3D points from an (N, 2) array of 2D points
+        of polygons given by an array of N indexes, by recalculating the omitted
+        less significant coordinate from each polygon's plane
+        """
+        rows = numpy.arange(len(points))
+        longest = self.longest[owners]
+        kept = self._kept[longest]
+        normals = self.normals[owners]
+        known = normals[rows[:, None], kept]
+        result = numpy.empty((len(points), 3))
+        result[rows[:, None], kept] = points
+        # the same as in Plane.to3D, e.g. x = -(y*b + z*c + 1*d) / a
+        result[rows, longest] = -(known[:, 0] * points[:, 0] + known[:, 1] * points[:, 1] +
+                                  self.d[owners]) / normals[rows, longest]
+        return result
+
+
 class Line(object):
     """
     Class representing  line in a 2D space
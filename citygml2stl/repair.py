@@ -0,0 +1,226 @@
+import collections
+import itertools
+
+import numpy
+
+from . import mesh
+
+
+# triangles with twice the area smaller than this (relative to the squared longest edge)
+# are considered to have no area
+AREA_TOLERANCE = 1e-12
+
+
+def _rows(array):
+    """
+    View the rows of a 2D array as single values, so they can be hashed and sorted
+    """
+    array = numpy.ascontiguousarray(array)
+    return array.view(numpy.dtype((numpy.void, array.dtype.itemsize * array.shape[1]))).ravel()
+
+
+# offsets of half of the 26 neighbouring grid cells, the other half is their opposite
+_NEIGHBOURS = [offset for offset in itertools.product((-1, 0, 1), repeat=3)
+               if offset > (0, 0, 0)]
+
+
+def _weld_cells(keys, first, points, tolerance):
+    """
+    Find grid cells (given by an (C, 3) array of their sorted keys) to weld to a neighbouring cell,
+    as their first points are closer than the tolerance
+
+    first are the positions of the first points of the cells in points.
+    Return an array of C cells every cell is welded to, cells not welded map to themselves,
+    cells welded together map to the one with the first point occurring first
+    """
+    rows = _rows(keys)
+    parents = numpy.arange(len(keys))
+    pairs = []
+    for offset in _NEIGHBOURS:
+        neighbours = _rows(keys + numpy.array(offset, dtype=keys.dtype))
+        found = numpy.minimum(numpy.searchsorted(rows, neighbours), len(rows) - 1)
+        cells = numpy.flatnonzero(rows[found] == neighbours)
+        others = found[cells]
+        distances = points[first[cells]] - points[first[others]]
+        close = (distances * distances).sum(axis=1) <= tolerance * tolerance
+        pairs += zip(cells[close].tolist(), others[close].tolist())
+    if not pairs:
+        return parents
+
+    # union-find on the few cells close to each other
+    def root(cell):
+        while parents[cell] != cell:
+            parents[cell] = parents[parents[cell]]
+            cell = parents[cell]
+        return cell
+
+    for a, b in pairs:
+        a, b = root(a), root(b)
+        if a != b:
+            if first[b] < first[a]:
+                a, b = b, a
+            parents[b] = a
+    for cell in set(cell for pair in pairs for cell in pair):
+        parents[cell] = root(cell)
+    return parents
+
+
+def weld_points(points, tolerance=None):
+    """
+    Weld identical points of an (N, 3) array
+
+    Return an (M, 3) array of distinct vertices, in the order of their first occurrence,
+    and an array of N indexes of the vertex of every point.
+    With a tolerance, points snapping to the same grid cell of that size are welded,
+    the first of them is kept. Neighbouring cells are welded too when their first points
+    are closer than the tolerance, so close points on both sides of a cell boundary
+    are not left apart.
+    """
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+    if not len(points):
+        return points, numpy.empty(0, dtype=numpy.intp)
+    if tolerance:
+        keys = numpy.round(points / tolerance).astype(numpy.int64)
+    else:
+        # -0.0 and 0.0 differ in bytes, adding 0.0 turns the former to the latter
+        keys = points + 0.0
+    unique, first, inverse = numpy.unique(_rows(keys), return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    if tolerance:
+        cells = _weld_cells(keys[first], first, points, tolerance)
+        inverse = cells[inverse]
+        kept = numpy.flatnonzero(cells == numpy.arange(len(cells)))
+    else:
+        kept = numpy.arange(len(first))
+    # number the vertices in the order of their first occurrence
+    order = kept[numpy.argsort(first[kept], kind='mergesort')]
+    renumber = numpy.empty(len(first), dtype=numpy.intp)
+    renumber[order] = numpy.arange(len(order))
+    return points[first[order]], renumber[inverse]
+
+
+def weld(triangles, tolerance=None):
+    """
+    Weld identical vertices of triangles (a TriangleMesh or an (N, 3, 3) array),
+    see weld_points()
+
+    Return an (M, 3) array of vertices and an (N, 3) array of faces indexing them.
+    """
+    if isinstance(triangles, mesh.TriangleMesh):
+        triangles = triangles.array
+    vertices, indexes = weld_points(numpy.asarray(triangles).reshape(-1, 3), tolerance)
+    return vertices, indexes.reshape(-1, 3)
+
+
+def degenerate(vertices, faces):
+    """
+    Return a boolean array of the faces without any area (collapsed to a line or a point)
+    """
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    u, v, w = b - a, c - a, c - b
+    # squared size of the cross product (twice the area) and of the longest edge
+    cross = u[:, [1, 2, 0]] * v[:, [2, 0, 1]] - u[:, [2, 0, 1]] * v[:, [1, 2, 0]]
+    longest = numpy.maximum(numpy.maximum((u * u).sum(axis=1), (v * v).sum(axis=1)),
+                            (w * w).sum(axis=1))
+    return (cross * cross).sum(axis=1) <= AREA_TOLERANCE ** 2 * longest ** 2
+
+
+def duplicate(faces):
+    """
+    Return a boolean array of the faces with the same vertices as some previous face,
+    regardless of their order
+    """
+    duplicates = numpy.ones(len(faces), dtype=bool)
+    if len(faces):
+        first = numpy.unique(_rows(numpy.sort(faces, axis=1)), return_index=True)[1]
+        duplicates[first] = False
+    return duplicates
+
+
+class EdgeIndex(object):
+    """
+    Class representing an index of edges of a mesh to the faces sharing them
+
+    Edges are identified by their positions in edges, an (E, 2) array of sorted vertex indexes
+    """
+
+    def __init__(self, faces):
+        """
+        Builds the index from an (N, 3) array of faces
+        """
+        halves = numpy.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+        self.edges, inverse, self.counts = numpy.unique(_rows(halves), return_inverse=True,
+                                                        return_counts=True)
+        self.edges = self.edges.view(halves.dtype).reshape(-1, 2)
+        inverse = inverse.ravel()
+        # faces of every edge one after another, edge by edge
+        self._faces = numpy.argsort(inverse, kind='mergesort') // 3
+        self._starts = numpy.concatenate(([0], numpy.cumsum(self.counts)))
+
+    def __len__(self):
+        return len(self.edges)
+
+    def faces(self, edge):
+        """
+        Return an array of the faces sharing the given edge
+        """
+        return self._faces[self._starts[edge]:self._starts[edge + 1]]
+
+    def open_edges(self):
+        """
+        Return an array of edges of only one face (on the boundary of a hole)
+        """
+        return numpy.flatnonzero(self.counts == 1)
+
+    def non_manifold_edges(self):
+        """
+        Return an array of edges of more than two faces
+        """
+        return numpy.flatnonzero(self.counts > 2)
+
+
+def repair(triangles, tolerance=None, stats=None):
+    """
+    Repair triangles (a TriangleMesh or an (N, 3, 3) array)
+
+    Vertices are welded (see weld()), triangles without any area and duplicate triangles
+    are dropped. Open and non-manifold edges left are found (see EdgeIndex).
+    Return the repaired TriangleMesh and an ordered dictionary counting all of those.
+    If stats are given, the repairing time and the counts are added to them.
+    """
+    if stats is not None:
+        stats.lap()
+    vertices, faces = weld(triangles, tolerance)
+    flat = degenerate(vertices, faces)
+    faces = faces[~flat]
+    twins = duplicate(faces)
+    faces = faces[~twins]
+    edges = EdgeIndex(faces)
+    report = collections.OrderedDict((
+        ('welded vertices', 3 * len(flat) - len(vertices)),
+        ('degenerate triangles', int(flat.sum())),
+        ('duplicate triangles', int(twins.sum())),
+        ('open edges', len(edges.open_edges())),
+        ('non-manifold edges', len(edges.non_manifold_edges())),
+    ))
+    if stats is not None:
+        for name, number in report.items():
+            stats.count(name, number)
+        stats.lap('repair')
+    return mesh.TriangleMesh.from_array(vertices[faces]), report
+
+
+class RepairingWriter(object):
+    """
+    Class passing triangles repaired by repair() to another writer (e.g. stl.StlFile)
+
+    Every call of write_triangles() is repaired on its own, e.g. every city object
+    """
+
+    def __init__(self, ofile, tolerance=None, stats=None):
+        self.ofile = ofile
+        self.tolerance = tolerance
+        self.stats = stats
+
+    def write_triangles(self, triangles):
+        self.ofile.write_triangles(repair(triangles, self.tolerance, self.stats)[0])
@@ -0,0 +1,294 @@
+import collections
+import json
+import os
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+from lxml import etree
+
+from . import citygml
+from . import exceptions
+from . import polygons
+from . import stl
+from . import transform
+from . import __version__
+
+
+class Document(object):
+    """
+    Class representing a parsed CityGML document kept in the DocumentCache,
+    together with the triangles of its city objects triangulated so far
+    """
+
+    # rough memory taken by one parsed XML element, in bytes
+    element_size = 256
+
+    def __init__(self, filename, member=None):
+        """
+        Saves the file to parse, the document is parsed by load()
+        """
+        self.filename = filename
+        self.member = member
+        self.mtime = os.path.getmtime(filename)
+        self.citygml = None
+        self.size = 0
+        self.triangles = {}
+        # held while parsing, so concurrent requests for the same file share one parse
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Parse the document unless it's already parsed, return True if it was parsed now
+        """
+        with self.lock:
+            if self.citygml is not None:
+                return False
+            c = citygml.CityGML(self.filename, member=self.member)
+            self.size = Document.element_size * sum(1 for element in c.tree.iter())
+            self.citygml = c
+            return True
+
+    def object2triangles(self, obj, merge=None, lod=None):
+        """
+        Return a TriangleMesh of the given city object, triangulate it only on first use
+        """
+        key = (obj, merge, lod)
+        triangles = self.triangles.get(key)
+        if triangles is None:
+            triangles = polygons.object2triangles(obj, merge=merge, ids=self.citygml.ids,
+                                                  lod=lod)
+            # another thread may have triangulated it meanwhile, the result is the same
+            if self.triangles.setdefault(key, triangles) is triangles:
+                self.size += triangles.array.nbytes
+        return triangles
+
+
+class DocumentCache(object):
+    """
+    Least recently used cache of parsed CityGML documents and their triangles
+
+    Documents are kept until their estimated memory exceeds the budget (in bytes),
+    the least recently used ones are dropped first.
+    A document is parsed again when its file was modified since it was parsed.
+    """
+
+    def __init__(self, budget=1024 * 1024 * 1024):
+        self.budget = budget
+        self.documents = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.parses = 0
+
+    def get(self, filename, member=None):
+        """
+        Return a loaded Document of the given file (and zip archive member)
+        """
+        key = (os.path.abspath(filename), member)
+        if not os.path.exists(filename):
+            raise exceptions.CityGMLInputError('{} does not exist'.format(filename))
+        with self.lock:
+            document = self.documents.pop(key, None)
+            if document is None or document.mtime != os.path.getmtime(filename):
+                document = Document(filename, member)
+            self.documents[key] = document
+        if document.load():
+            with self.lock:
+                self.parses += 1
+        self.shrink(keep=document)
+        return document
+
+    def size(self):
+        """
+        Return the estimated memory taken by all the documents, in bytes
+        """
+        return sum(document.size for document in self.documents.values())
+
+    def shrink(self, keep=None):
+        """
+        Drop the least recently used documents (but keep) until they fit into the budget
+        """
+        with self.lock:
+            for key, document in list(self.documents.items()):
+                if self.size() <= self.budget:
+                    break
+                if document is not keep:
+                    del self.documents[key]
+
+    def status(self):
+        """
+        Return a dictionary describing the cached documents, the least recently used first
+        """
+        with self.lock:
+            return {
+                'budget': self.budget,
+                'size': self.size(),
+                'parses': self.parses,
+                'documents': [{'file': key[0], 'member': key[1], 'size': document.size,
+                               'objects': len(document.triangles)}
+                              for key, document in self.documents.items()],
+            }
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handler of HTTP requests to the conversion server
+
+    GET /convert?file=FILE converts the file and streams STL back, optional parameters are
+    member (a file in a zip archive), type (repeatable), bbox=MINX,MINY,MAXX,MAXY, binary=1,
+    merge=TOLERANCE, lod=N (or highest or lowest), center=1, ground=1 and scale=FACTOR.
+    GET /status returns the cached documents as JSON.
+    Errors are answered with 400 for bad requests, 404 for missing files,
+    422 for files that cannot be converted and 500 for files that cannot be read.
+    Files are looked up relative to the root of the server and cannot be outside of it.
+    """
+    server_version = 'citygml2stl/' + __version__
+
+    def do_GET(self):
+        self.streaming = False
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            if url.path == '/convert':
+                self.convert(query)
+            elif url.path == '/status':
+                body = json.dumps(self.server.documents.status(), indent=2).encode('utf-8')
+                self.respond(200, 'application/json', body)
+            else:
+                self.respond(404, 'text/plain', b'Unknown path\n')
+        except (ValueError, KeyError) as e:
+            self.respond(400, 'text/plain', 'Bad request: {}\n'.format(e).encode('utf-8'))
+        except exceptions.CityGMLInputError as e:
+            self.respond(404, 'text/plain', 'Error: {}\n'.format(e).encode('utf-8'))
+        except (exceptions.CityGMLError, etree.XMLSyntaxError) as e:
+            self.respond(422, 'text/plain', 'Error: {}\n'.format(e).encode('utf-8'))
+        except (IOError, OSError) as e:
+            # the response cannot be changed once the STL is being sent
+            if self.streaming:
+                raise
+            self.respond(500, 'text/plain', 'Error: {}\n'.format(e).encode('utf-8'))
+
+    def respond(self, code, content_type, body):
+        """
+        Send a complete response with the given body
+        """
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def filename(self, query):
+        """
+        Gets the path of the requested file, relative to the root of the server
+        """
+        root = os.path.realpath(self.server.root)
+        filename = os.path.realpath(os.path.join(root, query['file'][0]))
+        if os.path.commonprefix([filename, root + os.sep]) != root + os.sep:
+            raise ValueError('{} is outside of the served directory'.format(query['file'][0]))
+        return filename
+
+    def convert(self, query):
+        """
+        Convert the requested objects, stream STL back
+        """
+        filename = self.filename(query)
+        member = query.get('member', [None])[0]
+        types = query.get('type', [])
+        box = query.get('bbox', [None])[0]
+        box = box and [float(v) for v in box.split(',')]
+        if box is not None and len(box) != 4:
+            raise ValueError('bbox is not in form minx,miny,maxx,maxy')
+        merge = query.get('merge', [None])[0]
+        merge = merge and float(merge)
+        binary = query.get('binary', ['0'])[0] == '1'
+        lod = query.get('lod', [None])[0]
+        if lod is not None and lod not in polygons.Polygons.lod_policies:
+            lod = int(lod)
+        document = self.server.documents.get(filename, member)
+
+        c = document.citygml
+        if box:
+            objects = c.get_objects_in_bbox(*(box + types))
+        else:
+            objects = c.get_objects_of_types(*types)
+        if lod is not None:
+            objects = [obj for obj in objects if polygons.Polygons.has_lod(obj, lod)]
+        transformation = self.transformation(query, c, objects, lod)
+
+        # errors cannot be reported once the STL is being sent, triangulate first
+        results = [document.object2triangles(obj, merge, lod) for obj in objects]
+        self.server.documents.shrink(keep=document)
+
+        self.streaming = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'model/stl')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        with stl.StlFile(self.wfile, binary=binary, transform=transformation) as ofile:
+            for triangles in results:
+                ofile.write_triangles(triangles)
+
+    def transformation(self, query, c, objects, lod=None):
+        """
+        Construct the transform of the output coordinates asked for, None if there is none
+        """
+        center = query.get('center', ['0'])[0] == '1'
+        ground = query.get('ground', ['0'])[0] == '1'
+        scale = query.get('scale', [None])[0]
+        scale = scale and float(scale)
+        if not (center or ground or scale):
+            return None
+        box = c.extent(objects, lod) if center or ground else None
+        if box is None:
+            return transform.Transform(scale=scale or 1.0)
+        return transform.Transform.from_box(box, center=center, ground=ground, scale=scale)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ConversionServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server converting CityGML files under the given root directory,
+    keeping the parsed documents in a DocumentCache between requests
+
+    Every request is handled in its own thread
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 8023), root='.', budget=1024 * 1024 * 1024,
+                 verbose=False):
+        HTTPServer.__init__(self, address, ConversionRequestHandler)
+        self.root = root
+        self.documents = DocumentCache(budget)
+        self.verbose = verbose
+
+
+def address(value):
+    """
+    Parse a [HOST:]PORT address, return a (host, port) tuple
+    """
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def serve(addr, root='.', budget=1024 * 1024 * 1024, verbose=True):
+    """
+    Run the conversion server at the given (host, port) until interrupted
+    """
+    server = ConversionServer(addr, root, budget, verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
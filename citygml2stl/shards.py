@@ -0,0 +1,244 @@
+import collections
+import mmap
+import multiprocessing
+import os
+import re
+
+from lxml import etree
+
+from . import citygml
+from . import exceptions
+from . import polygons
+from . import spatial
+from . import stats as statistics
+
+
+MEMBER = b'cityObjectMember'
+
+# an optional slash of an end tag and an optional namespace prefix before MEMBER
+_before = re.compile(br'/?(?:[A-Za-z_][\w.-]*:)?\Z')
+_name = re.compile(br'[^\s/>]+')
+
+# default size of a shard in bytes
+SHARD_SIZE = 32 * 1024 * 1024
+
+
+def _after(data, token, start):
+    """
+    Gets the offset right after the first token in data from start,
+    raise CityGMLInputError if there is none (the file is truncated or malformed)
+    """
+    position = data.find(token, start)
+    if position < 0:
+        raise exceptions.CityGMLInputError(
+            'Unterminated markup at byte {}, expected {!r}'.format(start, token.decode('ascii')))
+    return position + len(token)
+
+
+def _root(data):
+    """
+    Find the root start tag, return its end offset and the qualified name of the root
+
+    The XML declaration, processing instructions, comments and doctype before it are skipped
+    """
+    position = 0
+    while True:
+        start = data.find(b'<', position)
+        if start < 0:
+            raise exceptions.CityGMLInputError('No root element found')
+        if data[start + 1:start + 2] == b'?':
+            position = _after(data, b'?>', start)
+        elif data[start + 1:start + 4] == b'!--':
+            position = _after(data, b'-->', start)
+        elif data[start + 1:start + 2] == b'!':
+            position = _after(data, b'>', start)
+        else:
+            end = _after(data, b'>', start)
+            name = _name.match(data[start + 1:end])
+            if name is None:
+                raise exceptions.CityGMLInputError('No root element found')
+            return end, name.group(0)
+
+
+def member_ranges(data, start=0):
+    """
+    Scan the data for city object members, yield (start, end) byte offsets of each of them
+
+    Only the members on the top level are found, the tags are found by plain byte search
+    without parsing anything, tags inside comments or CDATA are not recognized
+    """
+    depth = 0
+    begin = None
+    position = data.find(MEMBER, start)
+    while position >= 0:
+        opening = data.rfind(b'<', max(start, position - 256), position)
+        following = data[position + len(MEMBER):position + len(MEMBER) + 1]
+        if (opening >= 0 and following in (b'>', b'/', b' ', b'\t', b'\r', b'\n') and
+                _before.match(data[opening + 1:position])):
+            end = _after(data, b'>', position)
+            if data[opening + 1:opening + 2] == b'/':
+                depth -= 1
+                if not depth:
+                    yield begin, end
+            elif data[end - 2:end - 1] == b'/':
+                if not depth:
+                    yield opening, end
+            else:
+                if not depth:
+                    begin = opening
+                depth += 1
+            position = end
+        else:
+            position += len(MEMBER)
+        position = data.find(MEMBER, position)
+
+
+def plan_shards(filename, shard_size=SHARD_SIZE):
+    """
+    Split an uncompressed CityGML file to shards of whole city object members
+
+    Return the header of the document (everything up to the end of the root start tag,
+    so it carries all the namespace declarations), the footer (the root end tag)
+    and a list of (start, end) byte ranges of roughly shard_size bytes each
+    """
+    with open(filename, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            end, root = _root(data)
+            header = data[:end]
+            shards = []
+            first = last = None
+            for start, stop in member_ranges(data, end):
+                if first is None:
+                    first = start
+                elif stop - first > shard_size:
+                    shards.append((first, last))
+                    first = start
+                last = stop
+            if first is not None:
+                shards.append((first, last))
+        finally:
+            data.close()
+    return header, b'</' + root + b'>', shards
+
+
+def parse_shard(filename, header, footer, start, end):
+    """
+    Parse one shard of the file, return the root element wrapping its city object members
+    """
+    with open(filename, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            chunk = data[start:end]
+        finally:
+            data.close()
+    parser = etree.XMLParser(huge_tree=True)
+    return etree.fromstring(header + chunk + footer, parser)
+
+
+def _namespace(root):
+    """
+    Detect the CityGML namespace of the first city object member of a parsed shard
+    """
+    for member in citygml.CityGML._members(root):
+        return etree.QName(member).namespace
+    return None
+
+
+def _triangulate_shard(task):
+    """
+    Parse and triangulate one shard of the file, runs in a worker process
+
+    Return a list of meshes of the city objects and stats of the worker (None unless measured)
+    """
+    filename, header, footer, start, end, namespace, types, box, measure, merge, lod = task
+    stats = statistics.Stats() if measure else None
+    root = parse_shard(filename, header, footer, start, end)
+    if stats is not None:
+        stats.lap('parse')
+    c = citygml.CityGML(filename, stream=True)
+    results = []
+    for member in citygml.CityGML._members(root):
+        if etree.QName(member).namespace != namespace:
+            continue
+        for obj in member:
+            name = citygml.CityGML._local_name(obj)
+            if name is None or (types and name not in types):
+                continue
+            if box is not None:
+                objbox = c.bounding_box(obj, flat=True)
+                if not objbox or not spatial.intersects(
+                        (objbox[0], objbox[1], objbox[3], objbox[4]), box):
+                    continue
+            results.append(polygons.object2triangles(obj, stats, merge, lod=lod))
+        member.clear()
+    return results, stats
+
+
+def triangulate_file(filename, types=(), box=None, workers=None, shard_size=SHARD_SIZE,
+                     stats=None, merge=None, lod=None):
+    """
+    Triangulate city objects of the given types of a large file, parsing it in parallel
+
+    The file is memory-mapped and scanned for boundaries of city object members,
+    which are split to shards of roughly shard_size bytes. Every worker process parses
+    and triangulates its own shards, wrapped in the root element of the document
+    so the namespace declarations are kept.
+    Yields a TriangleMesh of every city object in the document order.
+    Only uncompressed files can be sharded and references (xlink:href)
+    are only resolved inside of each city object.
+    Shards are made smaller for small files, so every worker gets a few of them.
+    If box (minx, miny, maxx, maxy) is given, only objects intersecting it are triangulated.
+    If workers is None, the number of CPUs is used, with 1 worker no pool is used at all.
+    If stats are given, time of scanning and stats from the workers are added to them.
+    If merge is given, coplanar polygons are merged with that tolerance before triangulation.
+    If lod is given, only the geometry in that level of detail is triangulated.
+    """
+    filename = citygml.CityGML(filename, stream=True).filename
+    if filename.endswith('.zip') or any(filename.endswith(extension)
+                                        for extension in citygml.CityGML.compressions):
+        raise exceptions.CityGMLInputError(
+            '{} is compressed, only uncompressed files can be sharded'.format(filename))
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers > 1:
+        shard_size = max(1, min(shard_size, os.path.getsize(filename) // (workers * 4)))
+    if stats is not None:
+        stats.lap()
+    header, footer, shards = plan_shards(filename, shard_size)
+    if not shards:
+        raise exceptions.CityGMLInputError('Found no city objects in {}'.format(filename))
+    namespace = _namespace(parse_shard(filename, header, footer, *shards[0]))
+    if stats is not None:
+        stats.lap('scan')
+        stats.count('shards', len(shards))
+
+    tasks = ((filename, header, footer, start, end, namespace, set(types),
+              box and tuple(box), stats is not None, merge, lod) for start, end in shards)
+
+    def collect(results, worker_stats):
+        if stats is not None:
+            stats.merge(worker_stats)
+        return results
+
+    if workers < 2:
+        for task in tasks:
+            for triangles in collect(*_triangulate_shard(task)):
+                yield triangles
+        return
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_triangulate_shard, (task,)))
+            if len(pending) >= workers * 2:
+                for triangles in collect(*pending.popleft().get()):
+                    yield triangles
+        while pending:
+            for triangles in collect(*pending.popleft().get()):
+                yield triangles
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,75 @@
+import collections
+import math
+
+
+def intersects(a, b):
+    """
+    Whether two 2D bounding boxes (minx, miny, maxx, maxy) intersect (touching counts)
+    """
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class GridIndex(object):
+    """
+    Class representing a uniform grid spatial index of 2D bounding boxes
+
+    Items are identified by their positions in the list of boxes given on construction
+    """
+
+    def __init__(self, boxes, cells=None):
+        """
+        Builds the index from a list of (minx, miny, maxx, maxy) boxes, None for no box
+
+        The grid has cells x cells cells covering the extent of all the boxes,
+        if not given, it is chosen so there is about one box per cell
+        """
+        self.boxes = boxes
+        self.cells = collections.defaultdict(list)
+        valid = [box for box in boxes if box is not None]
+        if not valid:
+            self.extent = None
+            return
+
+        self.extent = (min(box[0] for box in valid), min(box[1] for box in valid),
+                       max(box[2] for box in valid), max(box[3] for box in valid))
+        self.size = cells or max(1, int(math.sqrt(len(valid))))
+        # avoid zero sized cells for degenerate extents
+        self.cell_width = (self.extent[2] - self.extent[0]) / float(self.size) or 1.0
+        self.cell_height = (self.extent[3] - self.extent[1]) / float(self.size) or 1.0
+
+        for position, box in enumerate(boxes):
+            if box is None:
+                continue
+            columns, rows = self._cell_ranges(box)
+            for column in columns:
+                for row in rows:
+                    self.cells[column, row].append(position)
+
+    def _cell_ranges(self, box):
+        """
+        Gets ranges of columns and rows of cells the given box overlaps
+        """
+        def cell(value, origin, size):
+            return min(self.size - 1, max(0, int(math.floor((value - origin) / size))))
+
+        columns = range(cell(box[0], self.extent[0], self.cell_width),
+                        cell(box[2], self.extent[0], self.cell_width) + 1)
+        rows = range(cell(box[1], self.extent[1], self.cell_height),
+                     cell(box[3], self.extent[1], self.cell_height) + 1)
+        return columns, rows
+
+    def query(self, minx, miny, maxx, maxy):
+        """
+        Return a sorted list of positions of boxes intersecting the given box
+        """
+        box = (minx, miny, maxx, maxy)
+        if self.extent is None or not intersects(box, self.extent):
+            return []
+        found = set()
+        columns, rows = self._cell_ranges(box)
+        for column in columns:
+            for row in rows:
+                for position in self.cells.get((column, row), ()):
+                    if position not in found and intersects(self.boxes[position], box):
+                        found.add(position)
+        return sorted(found)
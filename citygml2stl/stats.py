@@ -0,0 +1,80 @@
+import collections
+import json
+import time
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+
+class Stats(object):
+    """
+    Class collecting wall time per conversion stage and counts of processed things
+
+    Pass it to CityGML, Polygons methods and StlFile to instrument them,
+    without it (None, the default) nothing is measured.
+    Times measured in worker processes are merged, so they are summed over all the processes.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty stats and start measuring the total time
+        """
+        self.times = collections.OrderedDict()
+        self.counts = collections.OrderedDict()
+        self.started = clock()
+        self.last = self.started
+
+    def lap(self, stage=None):
+        """
+        Add the time since the last lap to the given stage
+
+        Without a stage, only start measuring the next lap
+        """
+        now = clock()
+        if stage is not None:
+            self.times[stage] = self.times.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def count(self, name, number=1):
+        """
+        Add number to the counter of the given name
+        """
+        self.counts[name] = self.counts.get(name, 0) + number
+
+    def merge(self, other):
+        """
+        Add times and counts of other stats (e.g. from a worker process) to these
+        """
+        for stage, seconds in other.times.items():
+            self.times[stage] = self.times.get(stage, 0.0) + seconds
+        for name, number in other.counts.items():
+            self.count(name, number)
+
+    def as_dict(self):
+        """
+        Return the stats as a dictionary
+        """
+        return collections.OrderedDict((
+            ('total', clock() - self.started),
+            ('times', self.times),
+            ('counts', self.counts),
+        ))
+
+    def to_json(self):
+        """
+        Return the stats as JSON
+        """
+        return json.dumps(self.as_dict(), indent=2)
+
+    def report(self):
+        """
+        Return the stats as a human readable table
+        """
+        lines = ['{:<24}{:>12.3f} s'.format('total', clock() - self.started)]
+        for stage, seconds in self.times.items():
+            lines.append('{:<24}{:>12.3f} s'.format(stage, seconds))
+        for name, number in self.counts.items():
+            lines.append('{:<24}{:>12d}'.format(name, number))
+        return '\n'.join(lines) + '\n'
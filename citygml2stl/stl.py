@@ -1,3 +1,14 @@
+import itertools
+import shutil
+import struct
+import tempfile
+
+import numpy
+
+from . import mesh
+from . import output
+
+
 class StlFile(object):
     """
     Class representing an STL file
@@ -5,7 +16,7 @@ class StlFile(object):
     Use within the with statement
     """
 
-    facet = '''  facet normal 0 0 0
+    facet = '''  facet normal {} {} {}
     outer loop
       vertex {} {} {}
       vertex {} {} {}
@@ -14,30 +25,164 @@ class StlFile(object):
   endfacet
 '''
 
-    def __init__(self, filename):
+    # binary STL: 80 bytes header, uint32 number of triangles and 50 bytes per triangle
+    header = b'citygml2stl binary STL'.ljust(80, b' ')
+    count = struct.Struct('<I')
+    record = struct.Struct('<12fH')
+    # the same record for packing arrays of triangles at once
+    records = numpy.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)),
+                           ('attribute', '<u2')])
+
+    # how many triangles to pack or format at once
+    chunk = 4096
+
+    # binary records for outputs that cannot seek back to write the number of triangles
+    # are kept in memory up to this size, then in a temporary file
+    spool = 64 * 1024 * 1024
+
+    def __init__(self, filename, binary=False, stats=None, transform=None):
         """
-        Saves the filename
+        Saves the filename and whether to write a binary STL
+
+        Instead of a filename, '-' for the standard output or a binary file object can be given.
+        Files named .gz, .bz2 or .xz are compressed on the fly.
+        If stats are given, the writing time and number of written triangles are added to them.
+        If a transform.Transform is given, triangles are transformed (in double precision)
+        before being written
         """
         self.filename = filename
+        self.binary = binary
+        self.stats = stats
+        self.transform = transform
 
     def __enter__(self):
         """
         Opens an STL file for writing
         """
-        self.file = open(self.filename, 'w')
-        self.file.write('solid citygml2stl\n')
+        self.file, self.owned = output.open_output(self.filename)
+        if self.binary:
+            self.triangles = 0
+            if output.is_seekable(self.file):
+                # the real number of triangles is written on exit
+                self.start = self.file.tell()
+                self.file.write(StlFile.header)
+                self.file.write(StlFile.count.pack(0))
+                self.records = self.file
+            else:
+                self.records = tempfile.SpooledTemporaryFile(max_size=StlFile.spool)
+        else:
+            self.file.write(b'solid citygml2stl\n')
         return self
 
+    @classmethod
+    def pack_triangles(cls, triangles):
+        """
+        Packs triangles to binary STL records, return bytes
+        """
+        return cls.pack_array(numpy.array(list(triangles), dtype=numpy.float64).reshape(-1, 3, 3))
+
+    @classmethod
+    def pack_array(cls, triangles):
+        """
+        Packs an (N, 3, 3) array of triangles to binary STL records, return bytes
+
+        Normals are computed from the vertices by the right hand rule
+        """
+        records = numpy.zeros(len(triangles), dtype=cls.records)
+        records['normal'] = mesh.normals(triangles)
+        records['vertices'] = triangles
+        return records.tobytes()
+
+    @classmethod
+    def format_triangles(cls, triangles):
+        """
+        Formats triangles (an (N, 3, 3) array or a list) to ASCII STL facets, return bytes
+
+        Normals are computed from the vertices by the right hand rule
+        """
+        triangles = numpy.asarray(triangles, dtype=numpy.float64).reshape(-1, 3, 3)
+        # adding 0.0 turns -0.0 to 0.0
+        values = numpy.hstack((mesh.normals(triangles), triangles.reshape(-1, 9))) + 0.0
+        return ''.join(cls.facet.format(*row) for row in values.tolist()).encode('ascii')
+
     def write_triangles(self, triangles):
         """
         Writes triangles to the openned file
+
+        Triangles can be a TriangleMesh (written straight from its array), an (N, 3, 3) array
+        or any iterable of triangles. In binary mode, triangles can also be given
+        as a packed buffer of binary STL records (not with a transform)
+        """
+        if self.stats is not None:
+            self.stats.lap()
+        if self.transform is not None:
+            triangles = self.transform.apply(triangles)
+        number = self._write_triangles(triangles)
+        if self.stats is not None:
+            self.stats.lap('write')
+            self.stats.count('written triangles', number)
+
+    def _write_triangles(self, triangles):
         """
-        for tri in triangles:
-            self.file.write(StlFile.facet.format(*[coord for vertex in tri for coord in vertex]))
+        Writes triangles to the openned file in chunks, return the number of written triangles
+        """
+        if self.binary and isinstance(triangles, (bytes, bytearray, memoryview)):
+            buf = memoryview(triangles)
+            size = len(buf) * buf.itemsize
+            if size % StlFile.record.size:
+                raise ValueError('Packed triangles are not aligned to {} bytes records'.format(
+                    StlFile.record.size))
+            self.records.write(triangles)
+            self.triangles += size // StlFile.record.size
+            return size // StlFile.record.size
+
+        if isinstance(triangles, mesh.TriangleMesh):
+            triangles = triangles.array
+        if isinstance(triangles, numpy.ndarray):
+            for start in range(0, len(triangles), StlFile.chunk):
+                part = triangles[start:start + StlFile.chunk]
+                if self.binary:
+                    self.records.write(StlFile.pack_array(part))
+                else:
+                    self.file.write(StlFile.format_triangles(part))
+            if self.binary:
+                self.triangles += len(triangles)
+            return len(triangles)
+
+        number = 0
+        triangles = iter(triangles)
+        while True:
+            part = list(itertools.islice(triangles, StlFile.chunk))
+            if not part:
+                break
+            if self.binary:
+                self.records.write(StlFile.pack_triangles(part))
+            else:
+                self.file.write(StlFile.format_triangles(part))
+            number += len(part)
+        if self.binary:
+            self.triangles += number
+        return number
 
     def __exit__(self, type, value, traceback):
         """
         End the syntax and close the file
         """
-        self.file.write('endsolid citygml2stl\n')
-        self.file.close()
+        if self.binary:
+            if self.records is self.file:
+                end = self.file.tell()
+                self.file.seek(self.start + len(StlFile.header))
+                self.file.write(StlFile.count.pack(self.triangles))
+                self.file.seek(end)
+            else:
+                self.file.write(StlFile.header)
+                self.file.write(StlFile.count.pack(self.triangles))
+                self.records.seek(0)
+                shutil.copyfileobj(self.records, self.file, output.BUFFER)
+                self.records.close()
+        else:
+            self.file.write(b'endsolid citygml2stl\n')
+        if self.owned:
+            self.file.close()
+        else:
+            self.file.flush()
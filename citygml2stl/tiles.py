@@ -0,0 +1,120 @@
+import collections
+import math
+import multiprocessing
+
+from lxml import etree
+
+from . import mesh
+from . import polygons
+from . import repair as repairing
+from . import stats as statistics
+from . import stl
+
+
+def tile_objects(c, objects, tile_size):
+    """
+    Bin city objects to a grid of square tiles of the given size by the centers of their footprints
+
+    The grid starts at the minimal x and y of all the objects' bounding boxes.
+    Return an ordered dictionary of (row, column) to lists of objects,
+    only tiles with some objects are present, objects without any coordinates are skipped.
+    """
+    centers = []
+    for obj in objects:
+        box = c.bounding_box(obj, flat=True)
+        if box is not None:
+            centers.append(((box[0] + box[3]) / 2.0, (box[1] + box[4]) / 2.0, obj))
+    tiles = collections.OrderedDict()
+    if not centers:
+        return tiles
+
+    minx = min(center[0] for center in centers)
+    miny = min(center[1] for center in centers)
+    for x, y, obj in centers:
+        row = int(math.floor((y - miny) / tile_size))
+        column = int(math.floor((x - minx) / tile_size))
+        tiles.setdefault((row, column), []).append(obj)
+    return collections.OrderedDict(sorted(tiles.items()))
+
+
+def tile_filename(name, row, column):
+    """
+    Gets a filename of the STL file of the given tile
+    """
+    return '{}_{}_{}.stl'.format(name, row, column)
+
+
+def _export_tile(task):
+    """
+    Triangulate serialized city objects of one tile and write them to an STL file
+
+    Runs in a worker process, return the filename, the number of triangles
+    and stats of the worker (None unless measured),
+    the file is not written when there are no triangles
+    """
+    filename, objects, binary, measure, merge, lod, repair, transform = task
+    stats = statistics.Stats() if measure else None
+    triangles = mesh.TriangleMesh()
+    for obj in objects:
+        obj = etree.fromstring(obj)
+        if stats is not None:
+            stats.lap('deserialize')
+        triangles += polygons.object2triangles(obj, stats, merge, lod=lod)
+    if repair is not None:
+        triangles = repairing.repair(triangles, repair, stats)[0]
+    if triangles:
+        with stl.StlFile(filename, binary=binary, stats=stats, transform=transform) as ofile:
+            ofile.write_triangles(triangles)
+    return filename, len(triangles), stats
+
+
+def export_tiles(c, name, tile_size, objects=None, binary=False, workers=None, stats=None,
+                 merge=None, lod=None, repair=None, transform=None):
+    """
+    Export city objects to one STL file per tile, named name_<row>_<column>.stl
+
+    City objects (all of them if not given) are binned with tile_objects()
+    and every tile is triangulated and written in a pool of worker processes,
+    so only the objects of a few tiles are being triangulated at once.
+    Tiles are serialized and sent to the pool only a few per worker ahead of the written ones.
+    If workers is None, the number of CPUs is used, with 1 worker no pool is used at all.
+    If stats are given, stats from the workers are merged to them.
+    If merge is given, coplanar polygons are merged with that tolerance before triangulation.
+    If lod is given, only the geometry in that level of detail is triangulated.
+    If repair is given, triangles of every tile are repaired with that tolerance,
+    see repair.repair().
+    If a transform.Transform is given, all tiles are transformed by it.
+    Return a list of written filenames, empty tiles are skipped.
+    """
+    if objects is None:
+        objects = c.get_objects_of_types()
+    tiles = tile_objects(c, objects, tile_size)
+    tasks = ((tile_filename(name, row, column), [etree.tostring(obj) for obj in tile], binary,
+              stats is not None, merge, lod, repair, transform)
+             for (row, column), tile in tiles.items())
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers < 2:
+        results = [_export_tile(task) for task in tasks]
+    else:
+        results = []
+        pool = multiprocessing.Pool(workers)
+        try:
+            pending = collections.deque()
+            for task in tasks:
+                pending.append(pool.apply_async(_export_tile, (task,)))
+                if len(pending) >= workers * 2:
+                    results.append(pending.popleft().get())
+            while pending:
+                results.append(pending.popleft().get())
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    if stats is not None:
+        stats.count('tiles', len(tiles))
+        for filename, number, worker_stats in results:
+            stats.merge(worker_stats)
+    return [filename for filename, number, worker_stats in results if number]
@@ -0,0 +1,65 @@
+import numpy
+
+from . import mesh
+
+
+class Transform(object):
+    """
+    Class representing a translation followed by a uniform scaling of coordinates
+
+    A point p is transformed to (p - origin) * scale, in double precision,
+    so moving large projected coordinates close to the origin before they are written
+    as single precision floats (e.g. to binary STL) keeps their precision
+    """
+
+    def __init__(self, origin=(0.0, 0.0, 0.0), scale=1.0):
+        """
+        Saves the origin (moved to 0, 0, 0) and the scale
+        """
+        self.origin = numpy.array(origin, dtype=numpy.float64)
+        self.scale = float(scale)
+
+    @classmethod
+    def from_box(cls, box, center=False, ground=False, scale=None, size=None):
+        """
+        Construct a transform from the 3D bounding box (minx, miny, minz, maxx, maxy, maxz)
+        of the transformed objects
+
+        With center, the center of the box is moved to the origin, with ground,
+        the bottom of the box is moved to z = 0. The coordinates are multiplied by scale,
+        or scaled to fit into size (width, depth, height) keeping the proportions.
+        When fitting into size, the box is moved to the origin as well: axes not centered
+        nor grounded start at 0, so the fitted box lies within [0, size] without them.
+        """
+        minimum = numpy.array(box[:3], dtype=numpy.float64)
+        maximum = numpy.array(box[3:], dtype=numpy.float64)
+        origin = numpy.zeros(3)
+        if center:
+            origin = (minimum + maximum) / 2
+        if ground:
+            origin[2] = minimum[2]
+        if size is not None:
+            moved = [center, center, center or ground]
+            origin = numpy.where(moved, origin, minimum)
+            extent = maximum - minimum
+            ratios = [float(s) / e for s, e in zip(size, extent) if e > 0]
+            scale = min(ratios) if ratios else None
+        return cls(origin, 1.0 if scale is None else scale)
+
+    def __repr__(self):
+        return '<Transform (p - {}) * {}>'.format(self.origin.tolist(), self.scale)
+
+    def apply(self, triangles):
+        """
+        Transform triangles, return a new (N, 3, 3) array
+
+        Triangles can be a TriangleMesh, an (N, 3, 3) array or any iterable of triangles
+        """
+        if isinstance(triangles, mesh.TriangleMesh):
+            triangles = triangles.array
+        elif isinstance(triangles, (bytes, bytearray, memoryview)):
+            raise ValueError('Packed triangles cannot be transformed')
+        elif not isinstance(triangles, numpy.ndarray):
+            triangles = list(triangles)
+        triangles = numpy.asarray(triangles, dtype=numpy.float64).reshape(-1, 3, 3)
+        return (triangles - self.origin) * self.scale
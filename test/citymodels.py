@@ -0,0 +1,46 @@
+"""
+Synthetic CityGML documents and city objects for the tests
+"""
+from lxml import etree
+
+
+NAMESPACES = ('xmlns:core="http://www.opengis.net/citygml/2.0"\n'
+              '    xmlns:bldg="http://www.opengis.net/citygml/building/2.0"\n'
+              '    xmlns:gml="http://www.opengis.net/gml"')
+
+DOCUMENT = '''<?xml version="1.0" encoding="UTF-8"?>
+{prolog}<core:CityModel {namespaces}>
+{before}{members}{after}</core:CityModel>
+'''
+
+BUILDING = '''<bldg:Building {namespaces}gml:id="b{i}"><gml:MultiSurface>
+<gml:surfaceMember><gml:Polygon><gml:exterior><gml:LinearRing><gml:posList>
+{i} 0 {z} {j} 0 {z} {j} 1 {z} {i} 1 {z} {i} 0 {z}
+</gml:posList></gml:LinearRing></gml:exterior></gml:Polygon></gml:surfaceMember>
+</gml:MultiSurface></bldg:Building>'''
+
+
+def building(i, z=0):
+    """
+    Construct a Building with gml:id b<i> of one unit square from x = i to i + 1 at height z
+    """
+    return etree.fromstring(BUILDING.format(namespaces=NAMESPACES + ' ', i=i, j=i + 1, z=z))
+
+
+def document(number, prolog='', before='', after=''):
+    """
+    Construct the text of a CityGML document of the given number of buildings (see building()),
+    optionally with a prolog before the root and other content before and after the buildings
+    """
+    members = ''.join('<core:cityObjectMember>{}</core:cityObjectMember>\n'.format(
+        BUILDING.format(namespaces='', i=i, j=i + 1, z=0)) for i in range(number))
+    return DOCUMENT.format(prolog=prolog, namespaces=NAMESPACES, before=before,
+                           members=members, after=after)
+
+
+def write_document(path, number, **kwargs):
+    """
+    Write a CityGML document of the given number of buildings to path, see document()
+    """
+    with open(path, 'w') as f:
+        f.write(document(number, **kwargs))
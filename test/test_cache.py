@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from citygml2stl import cache
+from citygml2stl import polygons
+from citygml2stl import stats as statistics
+
+from . import citymodels
+
+
+class TestTriangleCache(object):
+    def convert(self, directory, objects, workers=1):
+        """
+        Convert the objects with a fresh cache, evict, return results, stats and evicted number
+        """
+        triangle_cache = cache.TriangleCache(directory)
+        stats = statistics.Stats()
+        results = list(triangle_cache.triangulate_objects(objects, workers=workers,
+                                                          chunksize=2, stats=stats))
+        return results, stats.counts, triangle_cache.evict()
+
+    @pytest.mark.parametrize('workers', (1, 2))
+    def test_rerun(self, tmpdir, workers):
+        """
+        Tests only new and changed objects are triangulated and stale entries are evicted
+        """
+        directory = str(tmpdir.join('cache'))
+        objects = [citymodels.building(i) for i in range(10)]
+        expected = [polygons.object2triangles(obj) for obj in objects]
+
+        results, counts, evicted = self.convert(directory, objects, workers)
+        assert results == expected
+        assert counts['triangulated objects'] == 10
+        assert evicted == 0
+
+        results, counts, evicted = self.convert(directory, objects, workers)
+        assert results == expected
+        assert counts['cached objects'] == 10
+        assert 'triangulated objects' not in counts
+
+        objects[3] = citymodels.building(3, z=5)
+        expected[3] = polygons.object2triangles(objects[3])
+        results, counts, evicted = self.convert(directory, objects[:8], workers)
+        assert results == expected[:8]
+        assert counts['cached objects'] == 7
+        assert counts['triangulated objects'] == 1
+        assert evicted == 3
+        assert len(os.listdir(directory)) == 8
+
+    def test_options_in_key(self, tmpdir):
+        """
+        Tests the same object triangulated with other options gets another key
+        """
+        triangle_cache = cache.TriangleCache(str(tmpdir))
+        obj = citymodels.building(1)
+        assert triangle_cache.key(obj) == triangle_cache.key(citymodels.building(1))
+        assert triangle_cache.key(obj) != triangle_cache.key(obj, merge=0.01)
+        assert triangle_cache.key(obj) != triangle_cache.key(citymodels.building(1, z=1))
+
+    def test_evict_foreign(self, tmpdir):
+        """
+        Tests evict() only removes cache entries and their temporary files
+        """
+        triangle_cache = cache.TriangleCache(str(tmpdir))
+        key = triangle_cache.key(citymodels.building(1))
+        for name in ('important.npy', 'notes.tmp', key + '.npy', key + '.npy.tmp'):
+            tmpdir.join(name).write('')
+        assert triangle_cache.evict() == 2
+        assert sorted(os.listdir(str(tmpdir))) == ['important.npy', 'notes.tmp']
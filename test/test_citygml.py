@@ -1,7 +1,15 @@
+import bz2
+import gzip
+import zipfile
+
 import pytest
 
 from citygml2stl import citygml
 from citygml2stl import exceptions
+from citygml2stl import polygons
+from citygml2stl import stats as statistics
+
+from . import citymodels
 
 
 class TestCityGML(object):
@@ -77,3 +85,226 @@ class TestCityGML(object):
         path = 'test/datasets/CityGML_2.0_Test_Dataset_2012-04-23/Part-3-Railway-V2.gml'
         c = citygml.CityGML(path)
         assert len(c.get_objects_of_types(*query)) == number
+
+    @pytest.mark.parametrize(('filename', 'number'),
+                             (('waldbruecke_v1.0.0.gml', 523),
+                              ('geoRES_testdata_v1.0.0', 30),
+                              ('CityGML_2.0_Test_Dataset_2012-04-23/Part-3-Railway-V2.gml', 10),
+                              ('Berlin_Alexanderplatz_v0.4.0.xml', 1123),))
+    def test_iter_city_objects_stream(self, filename, number):
+        """
+        Tests streaming yields the same number of city objects as parsing the whole tree
+        """
+        path = 'test/datasets/' + filename
+        c = citygml.CityGML(path, stream=True)
+        assert len(list(c.iter_city_objects())) == number
+
+    @pytest.mark.parametrize(('filename', 'ns'),
+                             (('Berlin_Alexanderplatz_v0.4.0.xml',
+                               'http://www.citygml.org/citygml/1/0/0'),
+                              ('geoRES_testdata_v1.0.0',
+                               'http://www.opengis.net/citygml/1.0'),
+                              ('CityGML_2.0_Test_Dataset_2012-04-23/Part-3-Railway-V2.gml',
+                               'http://www.opengis.net/citygml/2.0'),))
+    def test_stream_ns_recognition(self, filename, ns):
+        """
+        Tests the CityGML namespace is detected from the first streamed city object
+        """
+        path = 'test/datasets/' + filename
+        c = citygml.CityGML(path, stream=True)
+        assert c.namespace is None
+        next(c.iter_city_objects())
+        assert c.namespace == ns
+
+    @pytest.mark.parametrize(('query', 'number'),
+                             ((('Railway',), 10),
+                              (('Building',), 0),
+                              (('Building', 'Railway'), 10),
+                              (tuple(), 10)))
+    def test_iter_city_objects_of_types(self, query, number):
+        """
+        Test if iter_city_objects() filters types the same way get_objects_of_types() does
+        """
+        path = 'test/datasets/CityGML_2.0_Test_Dataset_2012-04-23/Part-3-Railway-V2.gml'
+        c = citygml.CityGML(path, stream=True)
+        assert len(list(c.iter_city_objects(*query))) == number
+
+    @pytest.mark.parametrize('stream', (False, True))
+    def test_types(self, stream):
+        """
+        Test if types() returns the types of city objects with counts
+        """
+        path = 'test/datasets/CityGML_2.0_Test_Dataset_2012-04-23/Part-3-Railway-V2.gml'
+        c = citygml.CityGML(path, stream=stream)
+        assert dict(c.types()) == {'Railway': 10}
+
+    def test_get_objects_of_types_document_order(self):
+        """
+        Test if objects of several types are returned in the document order
+        """
+        path = 'test/datasets/Berlin_Alexanderplatz_v0.4.0.xml'
+        c = citygml.CityGML(path)
+        types = list(c.types())
+        everything = c.get_objects_of_types()
+        assert len(everything) == sum(c.types().values())
+        assert c.get_objects_of_types(*types) == everything
+        assert c.get_objects_of_types(*reversed(types)) == everything
+
+    @pytest.mark.parametrize('stream', (False, True))
+    def test_objects_in_bbox(self, stream):
+        """
+        Test if objects in a bounding box are the ones whose bounding boxes intersect it
+        """
+        path = 'test/datasets/Berlin_Alexanderplatz_v0.4.0.xml'
+        c = citygml.CityGML(path)
+        boxes = [c.bounding_box(obj) for obj in c.get_objects_of_types('Building')]
+        minx = min(box[0] for box in boxes if box)
+        miny = min(box[1] for box in boxes if box)
+        query = (minx, miny, minx + 200, miny + 200)
+        expected = [obj for obj, box in zip(c.get_objects_of_types('Building'), boxes)
+                    if box and box[0] <= query[2] and box[1] <= query[3]]
+        assert 0 < len(expected) < len(boxes)
+        if stream:
+            c = citygml.CityGML(path, stream=True)
+            found = list(c.iter_objects_in_bbox(*(query + ('Building',))))
+            assert len(found) == len(expected)
+        else:
+            assert c.get_objects_in_bbox(*(query + ('Building',))) == expected
+
+    @pytest.mark.parametrize(('extension', 'opener'),
+                             (('.gz', gzip.GzipFile),
+                              ('.bz2', bz2.BZ2File),))
+    @pytest.mark.parametrize('stream', (False, True))
+    def test_open_compressed(self, tmpdir, extension, opener, stream):
+        """
+        Tests compressed files are decompressed while parsing
+        """
+        path = str(tmpdir.join('waldbruecke_v1.0.0.gml' + extension))
+        with open('test/datasets/waldbruecke_v1.0.0.gml', 'rb') as f:
+            with opener(path, 'wb') as compressed:
+                compressed.write(f.read())
+        c = citygml.CityGML(path, stream=stream)
+        assert len(list(c.iter_city_objects())) == 523
+
+    def test_open_zip(self, tmpdir):
+        """
+        Tests a zip archive with one CityGML file is read without extracting it
+        """
+        path = str(tmpdir.join('waldbruecke.zip'))
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.write('test/datasets/waldbruecke_v1.0.0.gml', 'waldbruecke_v1.0.0.gml')
+        c = citygml.CityGML(path)
+        assert c.member == 'waldbruecke_v1.0.0.gml'
+        assert len(c.city_objects) == 523
+
+    def test_open_zip_members(self):
+        """
+        Tests a zip archive with several CityGML files needs a member to be chosen
+        """
+        path = 'test/datasets/CityGML_2.0_Test_Dataset_2012-04-23.zip'
+        members = citygml.archive_members(path)
+        assert len(members) > 1
+        with pytest.raises(exceptions.CityGMLInputError):
+            citygml.CityGML(path)
+        member = [m for m in members if m.endswith('Part-3-Railway-V2.gml')][0]
+        c = citygml.CityGML(path, member=member, stream=True)
+        assert len(list(c.iter_city_objects())) == 10
+
+    def test_ids(self):
+        """
+        Tests elements are indexed by their gml:id and references in the railway are resolved
+        """
+        c = citygml.CityGML('test/datasets/CityGML_2.0_Test_Dataset_2012-04-23/'
+                            'Part-3-Railway-V2.gml')
+        assert c.ids
+        for key, element in c.ids.items():
+            assert element.get('{http://www.opengis.net/gml}id') == key
+        stats = statistics.Stats()
+        for obj in c.get_objects_of_types():
+            polygons.Polygons.extract_polygons(obj, c.ids, stats=stats)
+        assert stats.counts['xlinks'] > 0
+
+    @pytest.mark.parametrize('stream', (False, True))
+    def test_extent(self, stream):
+        """
+        Tests the extent covers bounding boxes of all the objects
+        """
+        path = 'test/datasets/Berlin_Alexanderplatz_v0.4.0.xml'
+        c = citygml.CityGML(path, stream=stream)
+        extent = c.extent()
+        boxes = [c.bounding_box(obj) for obj in citygml.CityGML(path).get_objects_of_types()]
+        boxes = [box for box in boxes if box]
+        assert extent[:3] == tuple(min(box[i] for box in boxes) for i in range(3))
+        assert extent[3:] == tuple(max(box[i] for box in boxes) for i in range(3, 6))
+
+    def test_get_objects_of_lod(self, tmpdir):
+        """
+        Tests only objects with geometry in the given level of detail are returned
+        """
+        polygon = ('<gml:Polygon><gml:exterior><gml:LinearRing><gml:posList>'
+                   '0 0 0 1 0 0 1 1 0 0 0 0</gml:posList></gml:LinearRing></gml:exterior>'
+                   '</gml:Polygon>')
+        path = str(tmpdir.join('lods.gml'))
+        with open(path, 'w') as f:
+            f.write('<core:CityModel xmlns:core="http://www.opengis.net/citygml/2.0" '
+                    'xmlns:bldg="http://www.opengis.net/citygml/building/2.0" '
+                    'xmlns:gml="http://www.opengis.net/gml">'
+                    '<core:cityObjectMember><bldg:Building><bldg:lod1MultiSurface>{0}'
+                    '</bldg:lod1MultiSurface><bldg:lod2MultiSurface>{0}</bldg:lod2MultiSurface>'
+                    '</bldg:Building></core:cityObjectMember>'
+                    '<core:cityObjectMember><bldg:Building><bldg:lod1MultiSurface>{0}'
+                    '</bldg:lod1MultiSurface></bldg:Building></core:cityObjectMember>'
+                    '<core:cityObjectMember><bldg:BuildingFurniture>{0}'
+                    '</bldg:BuildingFurniture></core:cityObjectMember>'
+                    '</core:CityModel>'.format(polygon))
+        c = citygml.CityGML(path)
+        assert len(c.get_objects_of_types(lod=1)) == 3
+        assert len(c.get_objects_of_types(lod=2)) == 2
+        assert len(c.get_objects_of_types('Building', lod=2)) == 1
+        assert len(c.get_objects_of_types('Building', lod='highest')) == 2
+        with pytest.raises(TypeError):
+            c.get_objects_of_types(level=2)
+
+    @pytest.mark.parametrize('stream', (False, True))
+    def test_extent_envelope_lod(self, tmpdir, stream):
+        """
+        Tests a 2D envelope is only used for x and y and lod limits the extent to its geometry
+        """
+        polygon = ('<gml:Polygon><gml:exterior><gml:LinearRing><gml:posList>'
+                   '0 0 {z} {x} 0 {z} {x} 1 {z} 0 0 {z}</gml:posList></gml:LinearRing>'
+                   '</gml:exterior></gml:Polygon>')
+        path = str(tmpdir.join('envelope.gml'))
+        with open(path, 'w') as f:
+            f.write('<core:CityModel xmlns:core="http://www.opengis.net/citygml/2.0" '
+                    'xmlns:bldg="http://www.opengis.net/citygml/building/2.0" '
+                    'xmlns:gml="http://www.opengis.net/gml">'
+                    '<core:cityObjectMember><bldg:Building>'
+                    '<gml:boundedBy><gml:Envelope srsDimension="2">'
+                    '<gml:lowerCorner>-5 -5</gml:lowerCorner><gml:upperCorner>5 5</gml:upperCorner>'
+                    '</gml:Envelope></gml:boundedBy>'
+                    '<bldg:lod1MultiSurface>{}</bldg:lod1MultiSurface>'
+                    '<bldg:lod2MultiSurface>{}</bldg:lod2MultiSurface>'
+                    '</bldg:Building></core:cityObjectMember>'
+                    '</core:CityModel>'.format(polygon.format(x=1, z=10),
+                                                polygon.format(x=2, z=20)))
+        c = citygml.CityGML(path, stream=stream)
+        obj = next(c.iter_city_objects())
+        assert c.bounding_box(obj) == (0, 0, 10, 2, 1, 20)
+        assert c.bounding_box(obj, flat=True) == (-5, -5, 0, 5, 5, 0)
+        assert c.extent(lod=1) == (0, 0, 10, 1, 1, 10)
+        assert c.extent(lod='highest') == (0, 0, 20, 2, 1, 20)
+
+    @pytest.mark.parametrize('query', (('get_objects_of_types', ()),
+                                       ('get_objects_in_bbox', (0, 0, 1, 1))))
+    def test_indexed_query_streaming(self, tmpdir, query):
+        """
+        Tests indexed queries of a streamed document raise a helpful error
+        """
+        path = str(tmpdir.join('stream.gml'))
+        citymodels.write_document(path, 1)
+        c = citygml.CityGML(path, stream=True)
+        method, args = query
+        with pytest.raises(exceptions.CityGMLInputError) as e:
+            getattr(c, method)(*args)
+        assert 'stream=True' in str(e.value)
+        assert len(list(c.iter_city_objects())) == 1
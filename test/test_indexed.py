@@ -0,0 +1,58 @@
+import numpy
+
+from citygml2stl import indexed
+
+
+class TestIndexedMeshFile(object):
+    triangles = [
+        [[0, 0, 0], [0, 1, 0], [1, 0, 0]],
+        [[0, 0, 0], [1, 0, 0], [0, 0, 1]],
+        [[0, 0, 0], [0, 0, 1], [0, 1, 0]],
+        [[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+    ]
+
+    def test_obj_welded(self):
+        """
+        Tests writing a dummy OBJ file welds the shared vertices
+        """
+        with indexed.ObjFile('test/dummy.obj') as test:
+            test.write_triangles(self.triangles[:2])
+            test.write_triangles(self.triangles[2:])
+        with open('test/dummy.obj') as f:
+            lines = f.read().splitlines()
+        vertices = [line for line in lines if line.startswith('v ')]
+        faces = [line for line in lines if line.startswith('f ')]
+        assert len(vertices) == 4
+        assert faces == ['f 1 2 3', 'f 1 3 4', 'f 1 4 2', 'f 3 2 4']
+
+    def test_obj_tolerance(self):
+        """
+        Tests welding with a tolerance drops collapsed faces
+        """
+        triangles = self.triangles + [[[0, 0, 0.001], [1, 0, 0], [0, 1, 0]]]
+        with indexed.ObjFile('test/dummy.obj', tolerance=0.01) as test:
+            test.write_triangles(triangles)
+        assert len(test.vertices) == 4
+        assert len(test.faces) == 5
+        with indexed.ObjFile('test/dummy.obj', tolerance=10) as test:
+            test.write_triangles(triangles)
+        assert len(test.vertices) == 1
+        assert len(test.faces) == 0
+
+    def test_ply(self):
+        """
+        Tests writing a dummy binary PLY file
+        """
+        with indexed.PlyFile('test/dummy.ply') as test:
+            test.write_triangles(self.triangles)
+        with open('test/dummy.ply', 'rb') as f:
+            data = f.read()
+        end = data.index(b'end_header\n') + len(b'end_header\n')
+        header = data[:end].decode('ascii')
+        assert 'element vertex 4\n' in header
+        assert 'element face 4\n' in header
+        vertices = numpy.frombuffer(data[end:end + 4 * 24], dtype='<f8').reshape(-1, 3)
+        assert vertices.tolist() == [[0, 0, 0], [0, 1, 0], [1, 0, 0], [0, 0, 1]]
+        faces = numpy.frombuffer(data[end + 4 * 24:], dtype=indexed.PlyFile.face)
+        assert faces['size'].tolist() == [3] * 4
+        assert faces['indices'].tolist() == [[0, 1, 2], [0, 2, 3], [0, 3, 1], [2, 1, 3]]
@@ -0,0 +1,87 @@
+import pickle
+
+import numpy
+
+from citygml2stl import mesh
+
+
+class TestTriangleMesh(object):
+    triangles = [
+        [[0, 0, 0], [0, 1, 0], [1, 0, 0]],
+        [[0, 0, 0], [1, 0, 0], [0, 0, 1]],
+        [[0, 0, 0], [0, 0, 1], [0, 1, 0]],
+    ]
+
+    def test_list_compatibility(self):
+        """
+        Tests the mesh behaves like the list of triangles it was constructed from
+        """
+        m = mesh.TriangleMesh(self.triangles)
+        assert len(m) == 3
+        assert list(m) == self.triangles
+        assert m == self.triangles
+        assert m[1].tolist() == self.triangles[1]
+        assert not mesh.TriangleMesh()
+
+    def test_append_extend(self):
+        """
+        Tests appending and extending grows the mesh preserving the order
+        """
+        m = mesh.TriangleMesh()
+        for i in range(100):
+            m.append(self.triangles[i % 3])
+        m.extend(mesh.TriangleMesh(self.triangles))
+        m += self.triangles
+        m += numpy.array(self.triangles)
+        assert len(m) == 109
+        assert list(m) == [self.triangles[i % 3] for i in range(100)] + self.triangles * 3
+        assert m.array.shape == (109, 3, 3)
+
+    def test_add(self):
+        """
+        Tests concatenation creates a new mesh
+        """
+        a = mesh.TriangleMesh(self.triangles[:1])
+        b = a + self.triangles[1:]
+        assert len(a) == 1
+        assert b == self.triangles
+
+    def test_from_array_zero_copy(self):
+        """
+        Tests wrapping an array does not copy it
+        """
+        array = numpy.array(self.triangles, dtype=numpy.float64)
+        m = mesh.TriangleMesh.from_array(array)
+        array[0, 0, 0] = 42
+        assert m[0, 0, 0] == 42
+
+    def test_pickle(self):
+        """
+        Tests the mesh survives pickling, as needed by worker processes
+        """
+        m = mesh.TriangleMesh(self.triangles)
+        m.append(self.triangles[0])
+        assert pickle.loads(pickle.dumps(m)) == m
+
+
+class TestNormals(object):
+    def test_normals(self):
+        """
+        Tests unit normals follow the right hand rule and are zero for triangles without area
+        """
+        triangles = numpy.array([[[0, 0, 0], [2, 0, 0], [0, 2, 0]],
+                                 [[0, 0, 0], [0, 0, 3], [3, 0, 0]],
+                                 [[0, 0, 0], [1, 1, 1], [2, 2, 2]]], dtype=float)
+        assert mesh.normals(triangles).tolist() == [[0, 0, 1], [0, 1, 0], [0, 0, 0]]
+
+    def test_orient(self):
+        """
+        Tests triangles are reversed to go counter-clockwise around the given directions
+        """
+        triangles = numpy.array([[[0, 0, 0], [1, 0, 0], [0, 1, 0]],
+                                 [[0, 0, 0], [0, 1, 0], [1, 0, 0]]], dtype=float)
+        oriented = mesh.orient(triangles.copy(), [0, 0, 1])
+        assert mesh.normals(oriented).tolist() == [[0, 0, 1], [0, 0, 1]]
+        assert oriented[0].tolist() == triangles[0].tolist()
+        oriented = mesh.orient(triangles.copy(), numpy.array([[0, 0, -1], [0, 0, 1]]))
+        assert mesh.normals(oriented).tolist() == [[0, 0, -1], [0, 0, 1]]
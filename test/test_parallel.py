@@ -0,0 +1,28 @@
+import pytest
+
+from citygml2stl import citygml
+from citygml2stl import parallel
+from citygml2stl import polygons
+
+
+class TestParallel(object):
+    @pytest.mark.parametrize('workers', (1, 2, 3))
+    def test_triangulate_objects_order(self, workers):
+        """
+        Tests the triangulation in a process pool gives the same results in the same order
+        """
+        path = 'test/datasets/Berlin_Alexanderplatz_v0.4.0.xml'
+        c = citygml.CityGML(path)
+        objects = c.get_objects_of_types('Building')[:50]
+        expected = [polygons.object2triangles(obj) for obj in objects]
+        results = list(parallel.triangulate_objects(objects, workers=workers, chunksize=4))
+        assert results == expected
+
+    def test_triangulate_streamed_objects(self):
+        """
+        Tests streamed objects can be triangulated in a process pool
+        """
+        path = 'test/datasets/waldbruecke_v1.0.0.gml'
+        c = citygml.CityGML(path, stream=True)
+        results = list(parallel.triangulate_objects(c.iter_city_objects(), workers=2))
+        assert len(results) == 523
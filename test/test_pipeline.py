@@ -0,0 +1,59 @@
+import pytest
+
+from citygml2stl import pipeline
+from citygml2stl import polygons
+
+from . import citymodels
+
+
+class Collector(object):
+    """
+    Mesh file keeping the written triangles, failing after the given number of writes
+    """
+
+    def __init__(self, fail=None):
+        self.written = []
+        self.fail = fail
+
+    def write_triangles(self, triangles):
+        if self.fail is not None and len(self.written) >= self.fail:
+            raise IOError('disk full')
+        self.written.append(triangles)
+
+
+class TestPipeline(object):
+    @pytest.mark.parametrize('workers', (1, 2))
+    def test_convert_order(self, workers):
+        """
+        Tests the pipeline writes the triangles in the order of the objects
+        """
+        objects = [citymodels.building(z) for z in range(50)]
+        expected = [polygons.object2triangles(obj) for obj in objects]
+        ofile = Collector()
+        number = pipeline.convert(iter(objects), ofile, workers=workers, chunksize=3,
+                                  queue_size=2)
+        assert number == 50
+        assert ofile.written == expected
+
+    def test_reader_error(self):
+        """
+        Tests an exception of the reader stops the pipeline and is raised
+        """
+        def objects():
+            for z in range(20):
+                yield citymodels.building(z)
+            raise ValueError('broken input')
+
+        ofile = Collector()
+        with pytest.raises(ValueError):
+            pipeline.convert(objects(), ofile, workers=1, chunksize=4, queue_size=1)
+        assert len(ofile.written) <= 20
+
+    @pytest.mark.parametrize('workers', (1, 2))
+    def test_writer_error(self, workers):
+        """
+        Tests an exception of the writer stops the pipeline and is raised
+        """
+        objects = (citymodels.building(z) for z in range(1000))
+        with pytest.raises(IOError):
+            pipeline.convert(objects, Collector(fail=5), workers=workers, queue_size=1)
@@ -1,11 +1,15 @@
 import operator
 import pytest
 
+import numpy
 import p2t
+from lxml import etree
 
 from citygml2stl import citygml
 from citygml2stl import exceptions
+from citygml2stl import mesh
 from citygml2stl import polygons
+from citygml2stl import stats as statistics
 
 
 class TestPolygons(object):
@@ -40,6 +44,61 @@ class TestPolygons(object):
         assert len(e) == enumber
         assert len(i) == inumber
 
+    @pytest.mark.parametrize('filename',
+                             ('waldbruecke_v1.0.0.gml',
+                              'geoRES_testdata_v1.0.0',
+                              'CityGML_2.0_Test_Dataset_2012-04-23/Part-3-Railway-V2.gml',
+                              'Berlin_Alexanderplatz_v0.4.0.xml'))
+    def test_ring_to_array_matches_points(self, filename):
+        """
+        Tests the array and the tuple API return the same points
+        """
+        path = 'test/datasets/' + filename
+        c = citygml.CityGML(path)
+        obj = c.get_objects_of_types()[0]
+        polygon = polygons.Polygons.extract_polygons(obj)[0]
+        exterior, interiors = polygons.Polygons.exterior_interiors(polygon)
+        array = polygons.Polygons.ring_to_array(exterior)
+        points = polygons.Polygons.ring_to_points(exterior)
+        assert array.shape == (len(points), 3)
+        assert array.tolist() == [list(p) for p in points]
+        assert all(isinstance(p, tuple) for p in points)
+
+    @pytest.mark.parametrize(('ring', 'result'),
+                             (('<gml:posList>0 0 1 1 0 1 1 1 1</gml:posList>',
+                               [[0, 0, 1], [1, 0, 1], [1, 1, 1]]),
+                              ('<gml:posList srsDimension="2">0 0 1 0 1 1</gml:posList>',
+                               [[0, 0, 0], [1, 0, 0], [1, 1, 0]]),
+                              ('<gml:pos>0 0 1</gml:pos><gml:pos>1 0 1</gml:pos>',
+                               [[0, 0, 1], [1, 0, 1]]),
+                              ('<gml:posList> </gml:posList>', []),))
+    def test_ring_to_array(self, ring, result):
+        """
+        Tests parsing coordinates from a ring, including 2D coordinates
+        """
+        ring = etree.fromstring(
+            '<gml:LinearRing xmlns:gml="{}">{}</gml:LinearRing>'.format(
+                polygons.Polygons.gml, ring))
+        array = polygons.Polygons.ring_to_array(ring)
+        assert array.shape == (len(result), 3)
+        assert numpy.array_equal(array, numpy.array(result).reshape(-1, 3))
+
+    @pytest.mark.parametrize('ring',
+                             ('<gml:posList>0 0 1 1 0 1 1 1</gml:posList>',
+                              '<gml:posList srsDimension="2">0 0 1 0 1</gml:posList>',
+                              '<gml:posList srsDimension="4">0 0 1 0</gml:posList>',
+                              '<gml:posList>0 0 1 1 0 1 1 1 x 0 0 1</gml:posList>',
+                              '<gml:posList>0 0 1 1,0 1 1 1 1</gml:posList>',))
+    def test_ring_to_array_malformed(self, ring):
+        """
+        Tests that coordinates not matching the dimension raise an exception
+        """
+        ring = etree.fromstring(
+            '<gml:LinearRing xmlns:gml="{}">{}</gml:LinearRing>'.format(
+                polygons.Polygons.gml, ring))
+        with pytest.raises(exceptions.CityGMLCoordinatesError):
+            polygons.Polygons.ring_to_array(ring)
+
     @pytest.mark.parametrize('filename',
                              ('waldbruecke_v1.0.0.gml',
                               'CityGML_2.0_Test_Dataset_2012-04-23/Part-3-Railway-V2.gml',
@@ -54,6 +113,245 @@ class TestPolygons(object):
         for obj in c.get_objects_of_types():
             polygons.object2triangles(obj)
 
+    @pytest.mark.parametrize(('points', 'tolerance', 'result'),
+                             (([[0, 0], [1, 0], [0, 0], [1, 1], [1, 0]], None,
+                               [[0, 0], [1, 0], [1, 1]]),
+                              ([[0, 0], [1, 0], [1, 0.125], [1, 1]], 0.5,
+                               [[0, 0], [1, 0], [1, 1]]),
+                              ([[0, 0], [1, 0], [1, 0.125], [1, 1]], None,
+                               [[0, 0], [1, 0], [1, 0.125], [1, 1]]),
+                              ([[0, 0], [1, 1], [0, 0], [2, 2], [-5, -5]], None, []),
+                              ([[0, 0], [0, 0], [0, 0]], None, []),))
+    def test_preprocess(self, points, tolerance, result):
+        """
+        Tests deduplication keeps the first occurrences in order and drops lines
+        """
+        points = [p2t.Point(*p) for p in points]
+        uniq = polygons.Polygons.preprocess(points, tolerance=tolerance)
+        assert [[p.x, p.y] for p in uniq] == result
+
+    @pytest.mark.parametrize(('rings', 'outlines'),
+                             (([[[(0, 0), (1, 0), (1, 1), (0, 1)]],
+                                [[(1, 0), (2, 0), (2, 1), (1, 1)]]], [(4, 0)]),
+                              ([[[(x, y), (x + 1, y), (x + 1, y + 1), (x, y + 1)]]
+                                for x in range(3) for y in range(3) if (x, y) != (1, 1)],
+                               [(4, 1)]),
+                              ([[[(0, 0), (1, 0), (1, 1), (0, 1)]],
+                                [[(2, 2), (3, 2), (3, 3), (2, 3)]]], [(4, 0), (4, 0)]),))
+    def test_merge_rings(self, rings, outlines):
+        """
+        Tests polygons sharing edges are merged to outlines with holes
+        """
+        merged = polygons.merge_rings(rings)
+        assert sorted((len(e), len(h)) for e, h in merged) == outlines
+        for exterior, holes in merged:
+            assert polygons.ring_area(exterior) > 0
+            assert all(polygons.ring_area(hole) < 0 for hole in holes)
+
+    @pytest.mark.parametrize('rings',
+                             ([[[(0, 0), (1, 0), (1, 1), (0, 1)]]] * 2,
+                              [[[(0, 0), (1, 0), (1, 1), (0, 1)]],
+                               [[(1, 1), (2, 1), (2, 2), (1, 2)]]],
+                              [[[(0, 0), (2, 0), (2, 1), (0, 1)]],
+                               [[(1, 0), (3, 0), (3, 1), (1, 1)]]],))
+    def test_merge_rings_refused(self, rings):
+        """
+        Tests overlapping polygons or polygons touching in a corner are not merged
+        """
+        assert polygons.merge_rings(rings) is None
+
+    @pytest.mark.parametrize(('rings', 'result'),
+                             (([[(0, 0), (2, 0), (2, 2), (0, 2)], [(1, 1), (1, 1.5), (1.5, 1)]],
+                               False),
+                              ([[(0, 0), (2, 0), (2, 2), (0, 2)], [(1, 1), (1, 3), (3, 1)]], True),
+                              ([[(0, 0), (2, 0), (0, 2), (2, 2)]], True),
+                              ([[(0, 0), (2, 0), (2, 2), (0, 2)], [(2, 2), (3, 2), (3, 3)]], True),
+                              ([[(0, 0), (4, 0), (4, 1), (0, 1)], [(1, 1), (2, 1), (2, 2)]], True),
+                              ([], False),))
+    def test_rings_intersect(self, rings, result):
+        """
+        Tests crossing, touching and collinear overlapping edges are found
+        """
+        assert polygons.rings_intersect(rings) == result
+
+    def test_merge_rings_large(self):
+        """
+        Tests a fan of triangles merged to an outline of many edges is not refused
+        """
+        angles = numpy.linspace(0, 2 * numpy.pi, 3001)[:-1]
+        circle = [(float(numpy.cos(a)), float(numpy.sin(a))) for a in angles]
+        rings = [[[(0.0, 0.0), p, q]] for p, q in zip(circle, circle[1:] + circle[:1])]
+        merged = polygons.merge_rings(rings)
+        assert [(len(e), len(h)) for e, h in merged] == [(3000, 0)]
+
+    def test_triangulate_merged(self):
+        """
+        Tests merging a split wall and a roof with a hole keeps the area with less triangles
+        """
+        quads = [[(0, 0, 0), (1, 0, 0), (1, 0, 1), (0, 0, 1)],
+                 [(1, 0, 0), (2, 0, 0), (2, 0, 1), (1, 0, 1)]]
+        quads += [[(x, y, 1), (x + 1, y, 1), (x + 1, y + 1, 1), (x, y + 1, 1)]
+                  for x in range(3) for y in range(3) if (x, y) != (1, 1)]
+        obj = etree.fromstring('<Building xmlns:gml="{}">{}</Building>'.format(
+            polygons.Polygons.gml, ''.join(
+                '<gml:Polygon><gml:exterior><gml:LinearRing><gml:posList>{}</gml:posList>'
+                '</gml:LinearRing></gml:exterior></gml:Polygon>'.format(
+                    ' '.join('{} {} {}'.format(*p) for p in quad + quad[:1]))
+                for quad in quads)))
+
+        def area(triangles):
+            t = triangles.array
+            return numpy.linalg.norm(numpy.cross(t[:, 1] - t[:, 0], t[:, 2] - t[:, 0]),
+                                     axis=1).sum() / 2
+
+        separate = polygons.object2triangles(obj)
+        stats = statistics.Stats()
+        merged = polygons.object2triangles(obj, stats, merge=0.01)
+        assert len(separate) == 20
+        assert len(merged) < len(separate)
+        assert stats.counts['triangles before merging'] == len(separate)
+        assert stats.counts['triangles'] == len(merged)
+        assert stats.counts['merged polygons'] == 10
+        assert abs(area(merged) - area(separate)) < 1e-9
+
+    @classmethod
+    def xlinked(cls, members):
+        """
+        Construct an object of a shared polygon and the given surface members
+        """
+        return etree.fromstring(
+            '<Building xmlns:gml="{}" xmlns:xlink="{}"><gml:MultiSurface gml:id="ms">'
+            '<gml:surfaceMember><gml:Polygon gml:id="p1"><gml:exterior><gml:LinearRing>'
+            '<gml:posList>0 0 0 1 0 0 1 1 0 0 0 0</gml:posList>'
+            '</gml:LinearRing></gml:exterior></gml:Polygon></gml:surfaceMember>'
+            '{}</gml:MultiSurface></Building>'.format(
+                polygons.Polygons.gml, polygons.Polygons.xlink, members))
+
+    @pytest.mark.parametrize(('members', 'unique', 'number', 'counts'),
+                             (('<gml:surfaceMember xlink:href="#p1"/>', True, 1,
+                               {'xlinks': 1, 'shared polygons': 1}),
+                              ('<gml:surfaceMember xlink:href="#p1"/>', False, 2,
+                               {'xlinks': 1}),
+                              ('<gml:surfaceMember xlink:href="#missing"/>', True, 1,
+                               {'unresolved xlinks': 1}),
+                              ('<gml:surfaceMember xlink:href="#ms"/>', False, 2,
+                               {'xlinks': 1, 'xlink cycles': 1}),
+                              ('<gml:surfaceMember xlink:href="#ms"/>', True, 1,
+                               {'xlinks': 1, 'xlink cycles': 1, 'shared polygons': 1}),))
+    def test_extract_xlinked_polygons(self, members, unique, number, counts):
+        """
+        Tests references to polygons and surfaces are resolved, skipping cycles and duplicates
+        """
+        obj = self.xlinked(members)
+        stats = statistics.Stats()
+        found = polygons.Polygons.extract_polygons(obj, unique=unique, stats=stats)
+        assert len(found) == number
+        assert all(etree.QName(p).localname == 'Polygon' for p in found)
+        assert dict(stats.counts) == counts
+
+    def test_extract_xlinked_polygons_index(self):
+        """
+        Tests references outside of the object are resolved through the given index
+        """
+        shared = self.xlinked('')
+        obj = self.xlinked('<gml:surfaceMember xlink:href="#shared"/>')
+        ids = {'shared': polygons.Polygons.extract_polygons(shared)[0]}
+        assert len(polygons.Polygons.extract_polygons(obj)) == 1
+        assert len(polygons.Polygons.extract_polygons(obj, ids)) == 2
+        assert len(polygons.object2triangles(obj, ids=ids)) == 2
+
+    @classmethod
+    def square(cls, z, id=None):
+        """
+        Construct a gml:Polygon of a unit square at the given height
+        """
+        return ('<gml:Polygon{}><gml:exterior><gml:LinearRing><gml:posList>'
+                '0 0 {z} 1 0 {z} 1 1 {z} 0 0 {z}</gml:posList></gml:LinearRing></gml:exterior>'
+                '</gml:Polygon>'.format(' gml:id="{}"'.format(id) if id else '', z=z))
+
+    @classmethod
+    def multi_lod(cls):
+        """
+        Construct a building with geometry in levels of detail 0 to 3
+        """
+        return etree.fromstring(
+            '<bldg:Building xmlns:bldg="http://www.opengis.net/citygml/building/2.0" '
+            'xmlns:gml="{gml}" xmlns:xlink="{xlink}">'
+            '<bldg:lod0FootPrint><gml:MultiSurface><gml:surfaceMember>{z0}</gml:surfaceMember>'
+            '</gml:MultiSurface></bldg:lod0FootPrint>'
+            '<bldg:lod1Solid><gml:Solid><gml:exterior><gml:CompositeSurface>'
+            '<gml:surfaceMember>{z1}</gml:surfaceMember><gml:surfaceMember>{z1}</gml:surfaceMember>'
+            '</gml:CompositeSurface></gml:exterior></gml:Solid></bldg:lod1Solid>'
+            '<bldg:lod2Solid><gml:Solid><gml:exterior><gml:CompositeSurface>'
+            '<gml:surfaceMember xlink:href="#wall"/>'
+            '</gml:CompositeSurface></gml:exterior></gml:Solid></bldg:lod2Solid>'
+            '<bldg:lod2TerrainIntersection><gml:MultiCurve/></bldg:lod2TerrainIntersection>'
+            '<bldg:boundedBy><bldg:WallSurface>'
+            '<bldg:lod2MultiSurface><gml:MultiSurface><gml:surfaceMember>{z2}</gml:surfaceMember>'
+            '</gml:MultiSurface></bldg:lod2MultiSurface>'
+            '<bldg:lod3MultiSurface><gml:MultiSurface><gml:surfaceMember>{z3}</gml:surfaceMember>'
+            '<gml:surfaceMember>{z3}</gml:surfaceMember><gml:surfaceMember>{z3}</gml:surfaceMember>'
+            '</gml:MultiSurface></bldg:lod3MultiSurface>'
+            '</bldg:WallSurface></bldg:boundedBy>'
+            '<bldg:lod4MultiCurve><gml:MultiCurve/></bldg:lod4MultiCurve>'
+            '</bldg:Building>'.format(gml=polygons.Polygons.gml, xlink=polygons.Polygons.xlink,
+                                      z0=cls.square(0), z1=cls.square(1),
+                                      z2=cls.square(2, 'wall'), z3=cls.square(3)))
+
+    @pytest.mark.parametrize(('lod', 'heights'),
+                             ((None, [0, 1, 1, 2, 3, 3, 3]),
+                              (0, [0]),
+                              (1, [1, 1]),
+                              (2, [2]),
+                              ('2', [2]),
+                              (3, [3, 3, 3]),
+                              (4, []),
+                              ('highest', [3, 3, 3]),
+                              ('lowest', [0]),))
+    def test_extract_lod_polygons(self, lod, heights):
+        """
+        Tests only polygons in the asked level of detail are extracted, xlinks are resolved
+        """
+        found = polygons.Polygons.extract_polygons(self.multi_lod(), lod=lod)
+        assert [polygons.Polygons.epoints_ipoints(p)[0][0, 2] for p in found] == heights
+        assert polygons.Polygons.has_lod(self.multi_lod(), lod) == bool(heights)
+        assert len(polygons.object2triangles(self.multi_lod(), lod=lod)) == len(heights)
+
+    def test_extract_lod_polygons_untagged(self):
+        """
+        Tests geometry not split by levels of detail is always extracted
+        """
+        obj = self.xlinked('')
+        for lod in (None, 1, 'highest'):
+            assert len(polygons.Polygons.extract_polygons(obj, lod=lod)) == 1
+        with pytest.raises(ValueError):
+            polygons.Polygons.extract_polygons(self.multi_lod(), lod='best')
+
+    @pytest.mark.parametrize('ring', ([[0, 0, 0], [4, 0, 0], [4, 3, 0], [0, 3, 0]],
+                                      [[0, 0, 0], [0, 3, 0], [4, 3, 0], [4, 0, 0]],
+                                      [[0, 0, 0], [0, 0, 2], [0, 4, 2], [0, 4, 0]],
+                                      [[0, 0, 0], [0, 4, 0], [0, 4, 2], [0, 0, 2]],
+                                      [[0, 5, 0], [4, 5, 0], [4, 5, 2], [0, 5, 2]],
+                                      [[0, 5, 0], [0, 5, 2], [4, 5, 2], [4, 5, 0]],
+                                      [[0, 0, 0], [4, 0, 1], [4, 3, 2], [0, 3, 1]],))
+    def test_triangles_orientation(self, ring):
+        """
+        Tests triangles keep the orientation of the ring, whichever coordinate is dropped in 2D
+        """
+        obj = etree.fromstring(
+            '<Building xmlns:gml="{}"><gml:Polygon><gml:exterior><gml:LinearRing>'
+            '<gml:posList>{}</gml:posList></gml:LinearRing></gml:exterior>'
+            '</gml:Polygon></Building>'.format(
+                polygons.Polygons.gml, ' '.join(str(c) for p in ring + ring[:1] for c in p)))
+        normal = numpy.array(polygons.Plane.newell(ring))
+        normal /= numpy.linalg.norm(normal)
+        for merge in (None, 0.01):
+            triangles = polygons.object2triangles(obj, merge=merge)
+            assert len(triangles) == 2
+            assert numpy.allclose(mesh.normals(triangles.array), normal)
+        polygon = polygons.Polygons.extract_polygons(obj)[0]
+        assert numpy.allclose(mesh.normals(polygons.Polygons.triangulate(polygon).array), normal)
+
 
 class TestPlane(object):
     @classmethod
@@ -164,6 +462,52 @@ class TestPlane(object):
         assert TestPlane.alike(polygons.Plane.crosspoints(*points), cross)
 
 
+class TestPlanes(object):
+    RINGS = [numpy.array([[0, 0, 0], [2, 0, 0], [2, 1, 0], [0, 1, 0]]),
+             numpy.array([[0, 0, 0], [1, 1, 1], [2, 2, 2]]),
+             numpy.array([[0, 0, 0], [1, 0, 0]]),
+             # the first three points almost form a line
+             numpy.array([[0, 0, 5], [1, 1e-9, 5], [2, 0, 5], [2, 0, 8], [0, 0, 8]]),
+             numpy.array([[-5, 2, -2.5], [0, 8, -2], [14, 5.6, -2]]) + 1e6]
+
+    def test_normals(self):
+        """
+        Test the planes are fitted the same way as by Plane.newell() and lines are not valid
+        """
+        planes = polygons.Planes(self.RINGS)
+        assert planes.valid.tolist() == [True, False, False, True, True]
+        for i in (0, 3, 4):
+            assert numpy.allclose(planes.normals[i], polygons.Plane.newell(self.RINGS[i]))
+        assert planes.longest[3] == 1
+        for i in (1, 2):
+            with pytest.raises(exceptions.PlaneConstructionError):
+                planes[i]
+
+    def test_to2D_to3D(self):
+        """
+        Test all the points of all the planes are converted to 2D and back at once
+        """
+        planes = polygons.Planes(self.RINGS)
+        points = numpy.concatenate([self.RINGS[i] for i in (0, 3, 4)]).astype(float)
+        owners = numpy.repeat([0, 3, 4], [4, 5, 3])
+        points2d = planes.to2D(points, owners)
+        assert points2d[:4].tolist() == self.RINGS[0][:, :2].tolist()
+        assert numpy.allclose(planes.to3D(points2d, owners), points)
+        for i in (0, 3, 4):
+            plane = planes[i]
+            point = self.RINGS[i][-1].tolist()
+            assert numpy.allclose(plane.to3D(plane.to2D(point)), point)
+
+    def test_fit(self):
+        """
+        Test fitting a single plane uses all the points, not just the first ones
+        """
+        plane = polygons.Plane.fit(self.RINGS[3])
+        assert plane.longest == 1
+        with pytest.raises(exceptions.PlaneConstructionError):
+            polygons.Plane.fit(self.RINGS[1])
+
+
 class TestLine(object):
     @pytest.mark.parametrize(('points', 'point', 'on'),
                              (([[1, 0], [1, 1]], [1, -150], True),
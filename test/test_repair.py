@@ -0,0 +1,93 @@
+import numpy
+import pytest
+
+from citygml2stl import mesh
+from citygml2stl import repair
+from citygml2stl import stats as statistics
+
+
+def cube():
+    """
+    Construct 12 triangles of a closed unit cube
+    """
+    corners = numpy.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)], float)
+    quads = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    faces = [face for a, b, c, d in quads for face in ((a, b, c), (a, c, d))]
+    return corners[numpy.array(faces)]
+
+
+class TestRepair(object):
+    @pytest.mark.parametrize(('tolerance', 'number'), ((None, 5), (0.01, 3)))
+    def test_weld(self, tolerance, number):
+        """
+        Tests identical (or close enough) vertices are welded, the first one is kept
+        """
+        triangles = numpy.array([[[0, 0, 0], [1, 0, 0], [0, 1, 0]],
+                                 [[0, 0, -0.0], [1.001, 0, 0], [0, 1.001, 0]]])
+        vertices, faces = repair.weld(triangles, tolerance)
+        assert len(vertices) == number
+        assert faces[0].tolist() == [0, 1, 2]
+        assert numpy.array_equal(vertices[faces[0]], triangles[0])
+
+    def test_weld_cell_boundary(self):
+        """
+        Tests close vertices on both sides of a grid cell boundary are welded, far ones are not
+        """
+        points = numpy.array([[0.0149, 0, 0], [0.0151, 0, 0], [0.0451, 0, 0], [0.03, 0, 0]])
+        vertices, indexes = repair.weld_points(points, 0.01)
+        assert indexes.tolist() == [0, 0, 1, 2]
+        assert vertices.tolist() == points[[0, 2, 3]].tolist()
+        vertices, indexes = repair.weld_points(points[[1, 0]], 0.01)
+        assert indexes.tolist() == [0, 0]
+        assert vertices.tolist() == [points[1].tolist()]
+
+    def test_clean(self):
+        """
+        Tests triangles without area and repeated triangles are found
+        """
+        triangles = numpy.array([[[0, 0, 0], [1, 0, 0], [0, 1, 0]],
+                                 [[0, 0, 0], [1, 0, 0], [2, 0, 0]],
+                                 [[0, 0, 0], [0, 0, 0], [0, 1, 0]],
+                                 [[1, 0, 0], [0, 0, 0], [0, 1, 0]]])
+        vertices, faces = repair.weld(triangles)
+        assert repair.degenerate(vertices, faces).tolist() == [False, True, True, False]
+        assert repair.duplicate(faces).tolist() == [False, False, False, True]
+
+    def test_edge_index(self):
+        """
+        Tests a closed cube has no open nor non-manifold edges, then removes and adds a face
+        """
+        vertices, faces = repair.weld(cube())
+        edges = repair.EdgeIndex(faces)
+        assert len(edges) == 18
+        assert (edges.counts == 2).all()
+        for edge in range(len(edges)):
+            for face in edges.faces(edge):
+                assert set(edges.edges[edge]) <= set(faces[face])
+
+        assert len(repair.EdgeIndex(faces[1:]).open_edges()) == 3
+        fin = numpy.vstack((faces, [faces[0][:2].tolist() + [len(vertices)]]))
+        edges = repair.EdgeIndex(fin)
+        assert len(edges.non_manifold_edges()) == 1
+        shared = edges.faces(edges.non_manifold_edges()[0]).tolist()
+        assert len(shared) == 3 and 0 in shared and 12 in shared
+
+    def test_repair(self):
+        """
+        Tests the repaired mesh and the counts of what was repaired
+        """
+        triangles = numpy.vstack((cube(), cube()[:1], [[[0, 0, 0], [0, 0, 0], [1, 1, 1]]]))
+        stats = statistics.Stats()
+        repaired, report = repair.repair(mesh.TriangleMesh(triangles), stats=stats)
+        assert repaired == cube()
+        assert report == dict((name, stats.counts.get(name, 0)) for name in report)
+        assert stats.counts['welded vertices'] == 14 * 3 - 8
+        assert stats.counts['degenerate triangles'] == 1
+        assert stats.counts['duplicate triangles'] == 1
+        assert stats.counts['open edges'] == 0
+        assert stats.counts['non-manifold edges'] == 0
+        assert len(repair.repair(mesh.TriangleMesh())[0]) == 0
+
+        report = repair.repair(cube()[1:])[1]
+        assert report['open edges'] == 3
+        assert report['non-manifold edges'] == 0
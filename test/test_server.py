@@ -0,0 +1,135 @@
+import io
+import os
+import threading
+
+try:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import urlopen, HTTPError
+
+import pytest
+
+from citygml2stl import citygml
+from citygml2stl import polygons
+from citygml2stl import server
+from citygml2stl import stl
+
+from . import citymodels
+
+
+@pytest.fixture
+def running(request, tmpdir):
+    citymodels.write_document(str(tmpdir.join('city.gml')), 10)
+    tmpdir.join('broken.gml').write('<core:CityModel><core:cityObjectMember>')
+    tmpdir.join('broken.gml.gz').write('not gzipped')
+    s = server.ConversionServer(('127.0.0.1', 0), root=str(tmpdir))
+    thread = threading.Thread(target=s.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        s.shutdown()
+        s.server_close()
+    request.addfinalizer(stop)
+    return s, 'http://127.0.0.1:{}'.format(s.server_address[1])
+
+
+class TestConversionServer(object):
+    def expected(self, path, binary, objects=None):
+        """
+        Convert the objects of the given file directly, return the STL
+        """
+        c = citygml.CityGML(path)
+        f = io.BytesIO()
+        with stl.StlFile(f, binary=binary) as ofile:
+            for obj in objects or c.get_objects_of_types():
+                ofile.write_triangles(polygons.object2triangles(obj, ids=c.ids))
+        return f.getvalue()
+
+    @pytest.mark.parametrize('binary', (0, 1))
+    def test_convert(self, tmpdir, running, binary):
+        """
+        Tests the streamed STL is the same as converted directly, the file is parsed once
+        """
+        s, url = running
+        path = str(tmpdir.join('city.gml'))
+        expected = self.expected(path, binary)
+        for i in range(3):
+            assert urlopen('{}/convert?file=city.gml&binary={}'.format(url, binary)).read() == \
+                expected
+        assert s.documents.parses == 1
+
+        c = citygml.CityGML(path)
+        boxed = urlopen('{}/convert?file=city.gml&binary={}&bbox=0.5,0,2.5,1&type=Building'.format(
+            url, binary)).read()
+        assert boxed == self.expected(path, binary, c.get_objects_of_types()[:3])
+        assert s.documents.parses == 1
+
+    def test_concurrent(self, running):
+        """
+        Tests concurrent requests for the same file share one parse
+        """
+        s, url = running
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            urlopen(url + '/convert?file=city.gml').read())) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(results) == 8
+        assert len(set(results)) == 1
+        assert s.documents.parses == 1
+
+    @pytest.mark.parametrize(('query', 'code'),
+                             (('file=missing.gml', 404),
+                              ('file=../city.gml', 400),
+                              ('file=city.gml&bbox=1,2', 400),
+                              ('file=broken.gml', 422),
+                              ('file=broken.gml.gz', 500),
+                              ('', 400),))
+    def test_errors(self, running, query, code):
+        """
+        Tests bad requests are refused
+        """
+        s, url = running
+        with pytest.raises(HTTPError) as e:
+            urlopen(url + '/convert?' + query)
+        assert e.value.code == code
+
+
+class TestDocumentCache(object):
+    def test_modified(self, tmpdir):
+        """
+        Tests a modified file is parsed again
+        """
+        path = str(tmpdir.join('city.gml'))
+        citymodels.write_document(path, 3)
+        documents = server.DocumentCache()
+        first = documents.get(path)
+        assert documents.get(path) is first
+        citymodels.write_document(path, 5)
+        os.utime(path, (first.mtime + 10, first.mtime + 10))
+        second = documents.get(path)
+        assert second is not first
+        assert len(second.citygml.get_objects_of_types()) == 5
+        assert documents.parses == 2
+
+    def test_budget(self, tmpdir):
+        """
+        Tests the least recently used documents are dropped to fit into the budget
+        """
+        paths = [str(tmpdir.join('city{}.gml'.format(i))) for i in range(3)]
+        for path in paths:
+            citymodels.write_document(path, 10)
+        documents = server.DocumentCache()
+        size = documents.get(paths[0]).size
+        documents.budget = 2 * size
+        for path in paths[1:] + paths[:1]:
+            documents.get(path)
+        expected = [os.path.abspath(p) for p in paths[2:] + paths[:1]]
+        assert [key[0] for key in documents.documents] == expected
+        documents.budget = 0
+        documents.shrink()
+        assert len(documents.documents) == 0
@@ -0,0 +1,82 @@
+import gzip
+
+import pytest
+
+from citygml2stl import citygml
+from citygml2stl import exceptions
+from citygml2stl import polygons
+from citygml2stl import shards
+
+from . import citymodels
+
+
+@pytest.fixture
+def document(tmpdir):
+    path = str(tmpdir.join('city.gml'))
+    citymodels.write_document(
+        path, 40,
+        prolog='<!-- <core:cityObjectMember> in a comment before the root -->\n',
+        before='<gml:name>cityObjectMember</gml:name>\n',
+        after='<core:cityObjectMember xlink:href="#elsewhere" '
+              'xmlns:xlink="http://www.w3.org/1999/xlink"/>\n')
+    return path
+
+
+class TestShards(object):
+    def test_member_ranges(self, document):
+        """
+        Tests all members are found, including empty ones, but not the decoys
+        """
+        with open(document, 'rb') as f:
+            data = f.read()
+        ranges = list(shards.member_ranges(data, data.index(b'<core:CityModel')))
+        assert len(ranges) == 41
+        for start, end in ranges:
+            assert data[start:end].startswith(b'<core:cityObjectMember')
+            assert data[start:end].endswith(b'</core:cityObjectMember>') or \
+                data[start:end].endswith(b'/>')
+
+    @pytest.mark.parametrize('data', (b'\n\n\n<!-- unterminated <core:CityModel>',
+                                      b'<?xml version="1.0"',
+                                      b'<!DOCTYPE core:CityModel',
+                                      b'<core:CityModel xmlns:core="x"',
+                                      b'<core:CityModel><core:cityObjectMember gml:id="m1"'))
+    def test_truncated(self, data):
+        """
+        Tests truncated markup raises an error instead of scanning forever
+        """
+        with pytest.raises(exceptions.CityGMLInputError):
+            end, root = shards._root(data)
+            list(shards.member_ranges(data, end))
+
+    def test_plan_shards(self, document):
+        """
+        Tests shards cover all the members in order without overlaps
+        """
+        header, footer, ranges = shards.plan_shards(document, 1000)
+        assert header.rstrip().endswith(b'xmlns:gml="http://www.opengis.net/gml">')
+        assert footer == b'</core:CityModel>'
+        assert len(ranges) > 1
+        assert all(a[1] <= b[0] for a, b in zip(ranges, ranges[1:]))
+
+    @pytest.mark.parametrize('workers', (1, 2))
+    def test_triangulate_file(self, document, workers):
+        """
+        Tests sharded triangulation gives the same results in the same order
+        """
+        c = citygml.CityGML(document)
+        expected = [polygons.object2triangles(obj) for obj in c.get_objects_of_types()]
+        results = list(shards.triangulate_file(document, workers=workers, shard_size=1000))
+        assert results == expected
+        boxed = list(shards.triangulate_file(document, box=(0.5, 0, 3.5, 1), workers=workers,
+                                             shard_size=1000))
+        assert boxed == expected[:4]
+
+    def test_triangulate_compressed(self, document):
+        """
+        Tests compressed files cannot be sharded
+        """
+        with open(document, 'rb') as f, gzip.open(document + '.gz', 'wb') as compressed:
+            compressed.write(f.read())
+        with pytest.raises(exceptions.CityGMLInputError):
+            list(shards.triangulate_file(document + '.gz'))
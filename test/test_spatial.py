@@ -0,0 +1,45 @@
+import pytest
+
+from citygml2stl import spatial
+
+
+class TestGridIndex(object):
+    boxes = [
+        (0, 0, 10, 10),
+        (20, 0, 30, 10),
+        None,
+        (0, 20, 10, 30),
+        (-100, -100, 100, 100),
+        (20, 20, 30, 30),
+    ]
+
+    @pytest.mark.parametrize(('box', 'result'),
+                             (((1, 1, 2, 2), [0, 4]),
+                              ((5, 5, 25, 25), [0, 1, 3, 4, 5]),
+                              ((10, 10, 20, 20), [0, 1, 3, 4, 5]),
+                              ((11, 11, 19, 19), [4]),
+                              ((200, 200, 300, 300), []),
+                              ((-1000, -1000, 1000, 1000), [0, 1, 3, 4, 5]),))
+    def test_query(self, box, result):
+        """
+        Tests the query returns positions of intersecting boxes
+        """
+        for cells in (None, 1, 7):
+            index = spatial.GridIndex(self.boxes, cells=cells)
+            assert index.query(*box) == result
+
+    def test_query_matches_brute_force(self):
+        """
+        Tests the index returns the same as checking every box
+        """
+        boxes = [(x, y, x + 3, y + 2) for x in range(0, 100, 7) for y in range(0, 100, 5)]
+        index = spatial.GridIndex(boxes)
+        for query in ((0, 0, 1, 1), (13, 13, 50, 20), (99, 99, 99, 99), (-5, 40, 200, 41)):
+            expected = [i for i, box in enumerate(boxes) if spatial.intersects(box, query)]
+            assert index.query(*query) == expected
+
+    def test_empty(self):
+        """
+        Tests an index without any boxes finds nothing
+        """
+        assert spatial.GridIndex([None, None]).query(0, 0, 1, 1) == []
@@ -0,0 +1,62 @@
+import json
+
+from citygml2stl import citygml
+from citygml2stl import parallel
+from citygml2stl import stats
+from citygml2stl import stl
+
+
+class TestStats(object):
+    def test_lap_and_count(self):
+        """
+        Tests laps add up to stages and counters add up
+        """
+        s = stats.Stats()
+        s.lap()
+        s.lap('a')
+        s.lap('a')
+        s.count('x')
+        s.count('x', 5)
+        assert list(s.times) == ['a']
+        assert s.times['a'] >= 0
+        assert s.counts['x'] == 6
+
+    def test_merge(self):
+        """
+        Tests merging stats from a worker sums them up
+        """
+        s = stats.Stats()
+        s.count('x', 2)
+        other = stats.Stats()
+        other.count('x', 3)
+        other.count('y')
+        other.times['a'] = 1.5
+        s.merge(other)
+        assert s.counts == {'x': 5, 'y': 1}
+        assert s.times['a'] == 1.5
+
+    def test_json(self):
+        """
+        Tests the stats can be dumped as JSON
+        """
+        s = stats.Stats()
+        s.count('x')
+        data = json.loads(s.to_json())
+        assert data['counts'] == {'x': 1}
+        assert data['total'] >= 0
+
+    def test_conversion_stats(self):
+        """
+        Tests the stats gathered through the whole conversion are consistent
+        """
+        s = stats.Stats()
+        c = citygml.CityGML('test/datasets/waldbruecke_v1.0.0.gml', stream=True, stats=s)
+        with stl.StlFile('test/waldbruecke.stl', binary=True, stats=s) as ofile:
+            for triangles in parallel.triangulate_objects(c.iter_city_objects(), workers=2,
+                                                          stats=s):
+                ofile.write_triangles(triangles)
+        assert s.counts['objects'] == 523
+        assert s.counts['triangles'] == s.counts['written triangles']
+        assert s.counts['rings'] == s.counts['polygons'] + s.counts['holes']
+        for stage in ('parse', 'coordinates', 'plane', 'triangulate', 'write'):
+            assert stage in s.times
@@ -1,3 +1,9 @@
+import gzip
+import io
+
+import numpy
+import pytest
+
 from citygml2stl import citygml
 from citygml2stl import exceptions
 from citygml2stl import polygons
@@ -37,3 +43,77 @@ class TestStlFile(object):
         with stl.StlFile('test/berlin.stl') as berlin:
             for obj in c.get_objects_of_types('Building'):
                 berlin.write_triangles(polygons.object2triangles(obj))
+
+    def test_stl_binary(self):
+        """
+        Tests writing a binary STL file with both triangles and packed records
+        """
+        triangles = [
+            [[0, 0, 0], [0, 1, 0], [1, 0, 0]],
+            [[0, 0, 0], [1, 0, 0], [0, 0, 1]],
+        ]
+        with stl.StlFile('test/dummy_binary.stl', binary=True) as test:
+            test.write_triangles(triangles)
+            test.write_triangles(stl.StlFile.pack_triangles(triangles))
+        with open('test/dummy_binary.stl', 'rb') as f:
+            data = f.read()
+        assert len(data) == 84 + 4 * 50
+        assert stl.StlFile.count.unpack(data[80:84]) == (4,)
+        record = stl.StlFile.record.unpack(data[84:134])
+        assert list(record[:3]) == [0, 0, -1]
+        assert list(record[3:12]) == [0, 0, 0, 0, 1, 0, 1, 0, 0]
+        assert data[84:184] == data[184:284]
+
+    def test_stl_binary_misaligned_buffer(self):
+        """
+        Tests that a packed buffer not aligned to records is refused
+        """
+        with pytest.raises(ValueError):
+            with stl.StlFile('test/dummy_binary.stl', binary=True) as test:
+                test.write_triangles(b'\0' * 49)
+
+    @pytest.mark.parametrize('binary', (False, True))
+    def test_stl_file_object(self, binary):
+        """
+        Tests writing to a seekable file object, keeping it open
+        """
+        triangles = [[[0, 0, 0], [0, 1, 0], [1, 0, 0]]] * 3
+        f = io.BytesIO()
+        f.write(b'prefix')
+        with stl.StlFile(f, binary=binary) as test:
+            test.write_triangles(triangles)
+        data = f.getvalue()[len(b'prefix'):]
+        if binary:
+            assert stl.StlFile.count.unpack(data[80:84]) == (3,)
+            assert len(data) == 84 + 3 * 50
+        else:
+            assert data.startswith(b'solid citygml2stl\n')
+            assert data.count(b'endfacet') == 3
+
+    def test_stl_binary_gzip(self, tmpdir):
+        """
+        Tests writing a compressed binary STL, which cannot seek back
+        """
+        triangles = [[[0, 0, 0], [0, 1, 0], [1, 0, 0]]] * 5
+        path = str(tmpdir.join('dummy.stl.gz'))
+        with stl.StlFile(path, binary=True) as test:
+            test.write_triangles(triangles)
+        with gzip.GzipFile(path, 'rb') as f:
+            data = f.read()
+        assert stl.StlFile.count.unpack(data[80:84]) == (5,)
+        assert len(data) == 84 + 5 * 50
+
+    def test_stl_normals(self):
+        """
+        Tests ASCII facets have unit normals by the right hand rule
+        """
+        triangles = numpy.array([[[0, 0, 0], [2, 0, 0], [0, 2, 0]],
+                                 [[0, 0, 0], [0, 0, -2], [0, 2, 0]],
+                                 [[0, 0, 0], [1, 1, 1], [2, 2, 2]]], dtype=float)
+        f = io.BytesIO()
+        with stl.StlFile(f) as test:
+            test.write_triangles(triangles)
+        lines = [line.strip() for line in f.getvalue().decode('ascii').splitlines()
+                 if 'normal' in line]
+        assert lines == ['facet normal 0.0 0.0 1.0', 'facet normal 1.0 0.0 0.0',
+                         'facet normal 0.0 0.0 0.0']
@@ -0,0 +1,33 @@
+import os
+
+from citygml2stl import citygml
+from citygml2stl import tiles
+
+
+class TestTiles(object):
+    def test_tile_objects(self):
+        """
+        Tests every object with coordinates ends up in exactly one tile
+        """
+        c = citygml.CityGML('test/datasets/Berlin_Alexanderplatz_v0.4.0.xml')
+        objects = c.get_objects_of_types('Building')
+        binned = tiles.tile_objects(c, objects, 100)
+        assert len(binned) > 1
+        assert sorted(binned) == list(binned)
+        flat = [obj for tile in binned.values() for obj in tile]
+        assert len(flat) == len(set(flat))
+        assert len(flat) == len([obj for obj in objects if c.bounding_box(obj)])
+
+    def test_export_tiles(self):
+        """
+        Tests exporting tiles writes one STL per non empty tile
+        """
+        c = citygml.CityGML('test/datasets/Berlin_Alexanderplatz_v0.4.0.xml')
+        objects = c.get_objects_of_types('Building')
+        written = tiles.export_tiles(c, 'test/berlin_tile', 250, objects=objects,
+                                     binary=True, workers=2)
+        binned = tiles.tile_objects(c, objects, 250)
+        assert 0 < len(written) <= len(binned)
+        for filename in written:
+            assert os.path.exists(filename)
+            os.remove(filename)
@@ -0,0 +1,69 @@
+import io
+
+import numpy
+import pytest
+
+from citygml2stl import mesh
+from citygml2stl import stl
+from citygml2stl import transform
+
+
+BOX = (1000.0, 2000.0, 50.0, 1100.0, 2050.0, 70.0)
+
+
+class TestTransform(object):
+    @pytest.mark.parametrize(('options', 'origin', 'scale'),
+                             (({}, [0, 0, 0], 1),
+                              ({'center': True}, [1050, 2025, 60], 1),
+                              ({'ground': True}, [0, 0, 50], 1),
+                              ({'center': True, 'ground': True}, [1050, 2025, 50], 1),
+                              ({'scale': 2}, [0, 0, 0], 2),
+                              ({'size': (200, 200, 200)}, [1000, 2000, 50], 2),
+                              ({'size': (10, 1000, 1000)}, [1000, 2000, 50], 0.1),
+                              ({'size': (10, 10, 10), 'ground': True}, [1000, 2000, 50], 0.1),
+                              ({'size': (10, 10, 10), 'center': True}, [1050, 2025, 60], 0.1),))
+    def test_from_box(self, options, origin, scale):
+        """
+        Tests the origin and the scale computed from a bounding box
+        """
+        t = transform.Transform.from_box(BOX, **options)
+        assert t.origin.tolist() == origin
+        assert t.scale == scale
+
+    def test_fit_projected(self):
+        """
+        Tests fitting projected coordinates into a print volume puts them inside it
+        """
+        base = numpy.array([5800000.0, 450000.0, 300.0])
+        triangles = numpy.array([[base, base + [250, 0, 0], base + [0, 120, 40]]])
+        size = (180, 180, 100)
+        box = tuple(triangles[0].min(axis=0).tolist() + triangles[0].max(axis=0).tolist())
+        fitted = transform.Transform.from_box(box, size=size).apply(triangles).reshape(-1, 3)
+        assert (fitted >= 0).all()
+        assert (fitted <= numpy.array(size) + 1e-9).all()
+        assert numpy.isclose(fitted[:, 0].max(), 180)
+
+    def test_apply(self):
+        """
+        Tests triangles of all the accepted types are transformed the same way
+        """
+        triangles = [[[1000, 2000, 50], [1100, 2000, 50], [1100, 2050, 70]]]
+        t = transform.Transform.from_box(BOX, center=True, ground=True, size=(10, 10, 10))
+        expected = numpy.array([[[-5, -2.5, 0], [5, -2.5, 0], [5, 2.5, 2]]])
+        for given in (triangles, numpy.array(triangles), mesh.TriangleMesh(triangles)):
+            assert numpy.allclose(t.apply(given), expected)
+        with pytest.raises(ValueError):
+            t.apply(b'\0' * 50)
+
+    def test_float32_precision(self):
+        """
+        Tests centering large coordinates before writing binary STL keeps centimeters
+        """
+        base = numpy.array([5500000.0, 450000.0, 300.0])
+        triangles = numpy.array([[base, base + [0.01, 0, 0], base + [0, 0.01, 0]]])
+        t = transform.Transform(origin=base)
+        f = io.BytesIO()
+        with stl.StlFile(f, binary=True, transform=t) as ofile:
+            ofile.write_triangles(triangles)
+        written = numpy.frombuffer(f.getvalue()[84:], dtype=stl.StlFile.records)['vertices']
+        assert numpy.allclose(written[0] + base, triangles[0], atol=1e-6, rtol=0)